@@ -0,0 +1,32 @@
+"""
+SQLite backend tuned for concurrent web and worker access.
+
+Django 4.2 opens ``atomic`` blocks with a plain (deferred) BEGIN, so a
+transaction that reads and then writes has to upgrade its lock mid-way. If
+another connection committed in between, SQLite fails the upgrade at once
+with "database is locked" instead of waiting out the busy timeout. Starting
+with BEGIN IMMEDIATE makes writers queue on the timeout instead, which is
+what Django 5.1's ``transaction_mode`` option does.
+
+Every new connection also runs ``pragmas``: WAL keeps readers off the
+writer's lock, and NORMAL sync is safe under WAL.
+"""
+from django.db.backends.sqlite3 import base
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    pragmas = ('PRAGMA journal_mode=WAL', 'PRAGMA synchronous=NORMAL')
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        for pragma in self.pragmas:
+            conn.execute(pragma)
+        return conn
+
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        self.transaction_mode = params.pop('transaction_mode', 'IMMEDIATE')
+        return params
+
+    def _start_transaction_under_autocommit(self):
+        self.cursor().execute(f'BEGIN {self.transaction_mode}')
@@ -4,14 +4,37 @@ from celery.schedules import crontab
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'dailydose.settings')
 
+from django.conf import settings  # noqa: E402
+
 app = Celery('dailydose')
 app.config_from_object('django.conf:settings', namespace='CELERY')
 app.autodiscover_tasks()
 
-# Celery Beat schedule for daily quote delivery
+# Celery Beat schedule for daily quote delivery: one run per delivery tick
+if settings.DELIVERY_TICK_MINUTES >= 60:
+    delivery_schedule = crontab(minute=0, hour='*')  # Run every hour to check user preferences
+else:
+    delivery_schedule = crontab(minute=f'*/{settings.DELIVERY_TICK_MINUTES}')
+
 app.conf.beat_schedule = {
     'send-daily-quotes': {
         'task': 'quotes.tasks.send_daily_quotes',
-        'schedule': crontab(minute=0, hour='*'),  # Run every hour to check user preferences
+        'schedule': delivery_schedule,
+    },
+    'dispatch-delivery-outbox': {
+        'task': 'quotes.tasks.dispatch_delivery_outbox',
+        'schedule': crontab(minute='*'),  # Retry failed deliveries once their backoff elapses
+    },
+    'refill-quote-queues': {
+        'task': 'quotes.tasks.refill_quote_queues',
+        'schedule': crontab(minute=0, hour=settings.QUOTE_QUEUE_REFILL_HOUR),  # Off-peak, so delivery ticks only pop
+    },
+    'refresh-delivery-slots': {
+        'task': 'quotes.tasks.refresh_delivery_slots',
+        'schedule': crontab(minute=50, hour='*'),  # Ahead of the next tick; a no-op outside DST transitions
+    },
+    'reconcile-analytics-rollups': {
+        'task': 'quotes.tasks.reconcile_analytics_rollups',
+        'schedule': crontab(minute=30, hour=3),  # Nightly, away from the busiest delivery ticks
     },
 }
@@ -1,15 +1,18 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
-from .models import User, Category, Quote, UserPreference, UserQuoteHistory
+from . import queue, search
+from .forms import QuoteAdminForm
+from .models import User, Category, Quote, UserPreference, UserQuoteHistory, DeliveryOutbox
 
 
 @admin.register(User)
 class UserAdmin(BaseUserAdmin):
     list_display = ['username', 'email', 'preferred_time', 'last_quote_sent', 'is_active']
-    list_filter = ['is_active', 'is_staff', 'preferred_time']
+    list_filter = ['is_active', 'is_staff', 'preferred_time', 'timezone']
     fieldsets = BaseUserAdmin.fieldsets + (
-        ('Quote Preferences', {'fields': ('preferred_time', 'last_quote_sent')}),
+        ('Quote Preferences', {'fields': ('preferred_time', 'timezone', 'delivery_slot', 'telegram_chat_id', 'last_quote_sent')}),
     )
+    readonly_fields = ['delivery_slot']
 
 
 @admin.register(Category)
@@ -25,6 +28,24 @@ class QuoteAdmin(admin.ModelAdmin):
     list_filter = ['category', 'is_active', 'created_at']
     search_fields = ['text', 'author']
     list_editable = ['is_active']
+    form = QuoteAdminForm
+
+    def get_search_results(self, request, queryset, search_term):
+        # Served from the full-text index instead of LIKE scans over search_fields
+        if not search_term:
+            return queryset, False
+        return search.matching(queryset, search_term), False
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        # Covers list_editable changes too, which are saved through here
+        if change and 'is_active' in form.changed_data and not obj.is_active:
+            queue.drop_quotes([obj.id])
+
+    def get_changelist_form(self, request, **kwargs):
+        # Legacy duplicates without a content hash get one on save, so check list edits too
+        kwargs.setdefault('form', QuoteAdminForm)
+        return super().get_changelist_form(request, **kwargs)
 
     def text_preview(self, obj):
         return obj.text[:75] + '...' if len(obj.text) > 75 else obj.text
@@ -33,8 +54,8 @@ class QuoteAdmin(admin.ModelAdmin):
 
 @admin.register(UserPreference)
 class UserPreferenceAdmin(admin.ModelAdmin):
-    list_display = ['user', 'delivery_paused', 'get_categories', 'updated_at']
-    list_filter = ['delivery_paused', 'preferred_categories']
+    list_display = ['user', 'delivery_paused', 'email_enabled', 'telegram_enabled', 'get_categories', 'updated_at']
+    list_filter = ['delivery_paused', 'email_enabled', 'telegram_enabled', 'preferred_categories']
     filter_horizontal = ['preferred_categories']
     search_fields = ['user__username', 'user__email']
 
@@ -53,3 +74,12 @@ class UserQuoteHistoryAdmin(admin.ModelAdmin):
     def quote_preview(self, obj):
         return obj.quote.text[:50] + '...' if len(obj.quote.text) > 50 else obj.quote.text
     quote_preview.short_description = 'Quote'
+
+
+@admin.register(DeliveryOutbox)
+class DeliveryOutboxAdmin(admin.ModelAdmin):
+    list_display = ['user', 'delivery_date', 'status', 'attempts', 'next_attempt_at', 'leased_until', 'sent_at']
+    list_filter = ['status', 'delivery_date']
+    search_fields = ['user__username', 'user__email']
+    raw_id_fields = ['user', 'quote']
+    readonly_fields = ['created_at', 'sent_at']
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class QuotesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'quotes'
+
+    def ready(self):
+        from . import profiling, signals  # noqa: F401
+        profiling.install_template_timer()
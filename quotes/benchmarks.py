@@ -0,0 +1,262 @@
+"""
+Helpers shared by the benchmark management commands.
+
+Benchmarks seed their data inside a transaction that is rolled back when
+they finish, so they can run against a development database without
+leaving rows behind.
+"""
+import asyncio
+import itertools
+import json
+import random
+import resource
+import statistics
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.core.mail.backends.base import BaseEmailBackend
+from django.db import connection, transaction
+from .models import Category, Quote, User, UserPreference, UserQuoteHistory
+
+
+@contextmanager
+def rolled_back():
+    """Run the block in a transaction that is always rolled back"""
+    with transaction.atomic():
+        yield
+        transaction.set_rollback(True)
+
+
+def seed_categories(count):
+    tag = uuid.uuid4().hex[:8]
+    return Category.objects.bulk_create([
+        Category(name=f'Bench {tag} {i}', slug=f'bench-{tag}-{i}')
+        for i in range(count)
+    ])
+
+
+def seed_quotes(count, categories, batch_size=5000, texts=None):
+    """
+    Bulk insert ``count`` quotes spread evenly over ``categories``, taking
+    their text from the ``texts`` iterator when given
+    """
+    for start in range(0, count, batch_size):
+        Quote.objects.bulk_create([
+            Quote(
+                text=next(texts) if texts else f'Benchmark quote number {i}',
+                author=f'Author {i % 1000}',
+                category=categories[i % len(categories)],
+            )
+            for i in range(start, min(start + batch_size, count))
+        ])
+
+
+def sentences(vocabulary_size=5000, length=(6, 16), seed=0):
+    """
+    Endless random sentences over a made-up vocabulary whose word frequencies
+    fall off like natural language (word ``n`` is drawn about 1/n as often).
+    """
+    rng = random.Random(seed)
+    syllables = ['ka', 'lo', 'mi', 'ren', 'su', 'ta', 'vo', 'shi', 'an', 'del', 'or', 'pe', 'qui', 'zan']
+    vocabulary = list(dict.fromkeys(
+        ''.join(rng.choice(syllables) for _ in range(rng.randint(2, 4))) for _ in range(vocabulary_size * 2)
+    ))[:vocabulary_size]
+    cum_weights = list(itertools.accumulate(1 / rank for rank in range(1, len(vocabulary) + 1)))
+    while True:
+        yield ' '.join(rng.choices(vocabulary, cum_weights=cum_weights, k=rng.randint(*length))).capitalize() + '.'
+
+
+def seed_users(count, batch_size=5000, **fields):
+    """Bulk insert ``count`` users with unusable passwords; returns their IDs"""
+    tag = uuid.uuid4().hex[:8]
+    for start in range(0, count, batch_size):
+        User.objects.bulk_create([
+            User(username=f'bench-{tag}-{i}', email=f'bench-{tag}-{i}@example.com', password='!', **fields)
+            for i in range(start, min(start + batch_size, count))
+        ])
+    return list(User.objects.filter(username__startswith=f'bench-{tag}-').values_list('id', flat=True))
+
+
+def seed_preferences(user_ids, categories, per_user=2, popular=5, popular_share=0.0, batch_size=5000):
+    """
+    Bulk insert default preferences for ``user_ids``, each preferring
+    ``per_user`` categories. A ``popular_share`` of the users take one of
+    ``popular`` fixed category sets; the rest choose at random.
+    """
+    per_user = min(per_user, len(categories))
+    popular_sets = [random.sample(categories, per_user) for _ in range(popular)]
+    through = UserPreference.preferred_categories.through
+    for start in range(0, len(user_ids), batch_size):
+        batch = user_ids[start:start + batch_size]
+        UserPreference.objects.bulk_create([UserPreference(user_id=user_id) for user_id in batch])
+        preference_ids = UserPreference.objects.filter(user_id__in=batch).values_list('id', flat=True)
+        through.objects.bulk_create([
+            through(userpreference_id=preference_id, category_id=category.id)
+            for preference_id in preference_ids
+            for category in (
+                random.choice(popular_sets) if random.random() < popular_share else random.sample(categories, per_user)
+            )
+        ])
+
+
+def seed_history(user_ids, quote_ids, days, now, favorite_ratio=0.05, batch_size=10000):
+    """
+    Insert one history row per user per day for the last ``days`` days.
+
+    Rows go in through the cursor because ``sent_at`` is ``auto_now_add``
+    and bulk_create would stamp every row with the current time.
+    """
+    table = UserQuoteHistory._meta.db_table
+    sql = f'INSERT INTO {table} (user_id, quote_id, sent_at, is_favorite) VALUES (%s, %s, %s, %s)'
+    rows = []
+    with connection.cursor() as cursor:
+        for user_id in user_ids:
+            for day in range(days):
+                quote_id = quote_ids[(user_id * 31 + day) % len(quote_ids)]
+                rows.append((user_id, quote_id, now - timedelta(days=day), random.random() < favorite_ratio))
+                if len(rows) == batch_size:
+                    cursor.executemany(sql, rows)
+                    rows = []
+        if rows:
+            cursor.executemany(sql, rows)
+
+
+def time_calls(func, repeat):
+    """Call ``func`` ``repeat`` times and return the median wall time in milliseconds"""
+    durations = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        durations.append((time.perf_counter() - started) * 1000)
+    return statistics.median(durations)
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far, in megabytes"""
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    scale = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+
+
+class StubEmailBackend(BaseEmailBackend):
+    """
+    Email backend that sends nothing but sleeps like a remote provider:
+    ``connect_latency`` seconds to open a connection and ``request_latency``
+    seconds per message, as SMTP and SendGrid's v3 API both cost a request
+    per message however many ``send_messages`` is given.
+    """
+    connect_latency = 0.05
+    request_latency = 0.005
+    sent = 0
+
+    def open(self):
+        if getattr(self, '_open', False):
+            return False
+        time.sleep(self.connect_latency)
+        self._open = True
+        return True
+
+    def close(self):
+        self._open = False
+
+    def send_messages(self, email_messages):
+        new_connection = self.open()
+        for message in email_messages:
+            time.sleep(self.request_latency)
+            message.message()
+        StubEmailBackend.sent += len(email_messages)
+        if new_connection:
+            self.close()
+        return len(email_messages)
+
+
+class FakeBotAPIServer:
+    """
+    Local stand-in for the Telegram Bot API ``sendMessage`` method.
+
+    Each request takes ``latency`` seconds. When ``rate_limit_every`` is set,
+    every Nth request is answered with a 429 asking the client to retry
+    after ``retry_after`` seconds. Accepted messages are kept in ``messages``.
+    Use as a context manager; ``url`` is the base URL to point the sender at.
+
+    The server runs its own event loop in one background thread, so it can
+    hold many keep-alive connections without competing for the GIL with a
+    thread per request.
+    """
+
+    def __init__(self, latency=0.0, rate_limit_every=0, retry_after=1):
+        self.latency = latency
+        self.rate_limit_every = rate_limit_every
+        self.retry_after = retry_after
+        self.messages = []
+        self.requests = 0
+
+    def __enter__(self):
+        started = threading.Event()
+        self._loop = asyncio.new_event_loop()
+
+        async def serve():
+            self._server = await asyncio.start_server(self._handle, '127.0.0.1', 0, backlog=1024)
+            self.url = f'http://127.0.0.1:{self._server.sockets[0].getsockname()[1]}'
+            started.set()
+
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+        self._thread.start()
+        asyncio.run_coroutine_threadsafe(serve(), self._loop)
+        started.wait()
+        return self
+
+    def __exit__(self, *exc_info):
+        async def shutdown():
+            self._server.close()
+            handlers = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+            for task in handlers:
+                task.cancel()
+            await asyncio.gather(*handlers, return_exceptions=True)
+            self._loop.stop()
+
+        asyncio.run_coroutine_threadsafe(shutdown(), self._loop)
+        self._thread.join()
+        self._loop.close()
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                head = await reader.readuntil(b'\r\n\r\n')
+                headers = dict(
+                    line.split(': ', 1) for line in head.decode().split('\r\n')[1:] if ': ' in line
+                )
+                lengths = {name.lower(): value for name, value in headers.items()}
+                payload = json.loads(await reader.readexactly(int(lengths['content-length'])))
+                if self.latency:
+                    await asyncio.sleep(self.latency)
+
+                self.requests += 1
+                if self.rate_limit_every and self.requests % self.rate_limit_every == 0:
+                    status, body = '429 Too Many Requests', {
+                        'ok': False,
+                        'error_code': 429,
+                        'description': f'Too Many Requests: retry after {self.retry_after}',
+                        'parameters': {'retry_after': self.retry_after},
+                    }
+                else:
+                    self.messages.append(payload)
+                    status, body = '200 OK', {
+                        'ok': True,
+                        'result': {'chat': {'id': payload['chat_id']}, 'text': payload['text']},
+                    }
+
+                data = json.dumps(body).encode()
+                writer.write(
+                    f'HTTP/1.1 {status}\r\nContent-Type: application/json\r\n'
+                    f'Content-Length: {len(data)}\r\n\r\n'.encode() + data
+                )
+                await writer.drain()
+        except (asyncio.IncompleteReadError, asyncio.CancelledError, ConnectionError):
+            pass
+        finally:
+            writer.close()
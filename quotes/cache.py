@@ -0,0 +1,26 @@
+"""
+Per-user cached page fragments.
+
+The dashboard body only changes when the user receives a quote, toggles a
+favorite or edits their preferences, so it is rendered once and served from
+the cache until one of those happens.
+"""
+from django.conf import settings
+from django.core.cache import cache
+
+
+def dashboard_key(user_id):
+    return f'quotes:dashboard:{user_id}'
+
+
+def get_dashboard(user_id):
+    return cache.get(dashboard_key(user_id))
+
+
+def set_dashboard(user_id, html):
+    cache.set(dashboard_key(user_id), html, settings.DASHBOARD_CACHE_TIMEOUT)
+
+
+def invalidate_dashboards(user_ids):
+    """Drop the cached dashboards of ``user_ids``"""
+    cache.delete_many([dashboard_key(user_id) for user_id in user_ids])
@@ -0,0 +1,142 @@
+"""
+Cached category list and active quote catalogue.
+
+Entries live in the shared cache under keys carrying a catalog version, and
+an in-process LRU sits in front of it so hot reads never leave the process.
+Any Quote or Category write bumps the version (see quotes.signals), which
+orphans every old key at once; other processes pick the new version up
+within CATALOG_LOCAL_TTL seconds.
+"""
+import threading
+import time
+from collections import OrderedDict, defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+
+VERSION_KEY = 'quotes:catalog:version'
+
+MISSING = object()
+
+
+class LocalLRU:
+    """Thread-safe least-recently-used map whose entries expire after ``ttl`` seconds"""
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return MISSING
+            value, expires = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return MISSING
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+local = LocalLRU(settings.CATALOG_LOCAL_SIZE, settings.CATALOG_LOCAL_TTL)
+
+
+def version():
+    current = local.get(VERSION_KEY)
+    if current is MISSING:
+        # Seeded from the clock so a version lost to eviction is never reused
+        current = cache.get_or_set(VERSION_KEY, time.time_ns, timeout=None)
+        local.set(VERSION_KEY, current)
+    return current
+
+
+def invalidate():
+    """Retire every catalog entry, here and in the shared cache"""
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, time.time_ns(), timeout=None)
+    local.clear()
+
+
+def key(name):
+    return f'quotes:catalog:{version()}:{name}'
+
+
+def cached(name, load):
+    """Return the catalog entry ``name``, calling ``load`` to build it on a miss"""
+    entry_key = key(name)
+    value = local.get(entry_key)
+    if value is MISSING:
+        value = cache.get(entry_key, MISSING)
+        if value is MISSING:
+            value = load()
+            cache.set(entry_key, value, settings.CATALOG_CACHE_TIMEOUT)
+        local.set(entry_key, value)
+    return value
+
+
+def categories():
+    """All categories ordered by name"""
+    from .models import Category
+
+    return cached('categories', lambda: list(Category.objects.order_by('name')))
+
+
+def quote_ids_by_category():
+    """``{category_id: [quote_id, ...]}`` for every active quote"""
+    from .models import Quote
+
+    def load():
+        pools = defaultdict(list)
+        rows = Quote.objects.filter(is_active=True).order_by('id').values_list('id', 'category_id')
+        for quote_id, category_id in rows.iterator(chunk_size=10000):
+            pools[category_id].append(quote_id)
+        return dict(pools)
+
+    return cached('quote_ids_by_category', load)
+
+
+def quotes(quote_ids):
+    """
+    ``{quote_id: Quote}`` for the active quotes among ``quote_ids``, with
+    ``category`` loaded. Inactive and unknown IDs are left out.
+    """
+    from .models import Quote
+
+    found = {}
+    keys = {key(f'quote:{quote_id}'): quote_id for quote_id in quote_ids}
+    for entry_key, quote_id in keys.items():
+        quote = local.get(entry_key)
+        if quote is not MISSING:
+            found[quote_id] = quote
+
+    missing = {entry_key: quote_id for entry_key, quote_id in keys.items() if quote_id not in found}
+    if missing:
+        for entry_key, quote in cache.get_many(missing).items():
+            found[missing[entry_key]] = quote
+            local.set(entry_key, quote)
+
+    unknown = [quote_id for quote_id in set(missing.values()) if quote_id not in found]
+    if unknown:
+        loaded = Quote.objects.select_related('category').filter(is_active=True).in_bulk(unknown)
+        entries = {key(f'quote:{quote_id}'): quote for quote_id, quote in loaded.items()}
+        cache.set_many(entries, settings.CATALOG_CACHE_TIMEOUT)
+        for entry_key, quote in entries.items():
+            local.set(entry_key, quote)
+        found.update(loaded)
+    return found
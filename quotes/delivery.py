@@ -0,0 +1,368 @@
+"""
+Batch delivery engine for the daily quote job.
+
+Users are selected in chunks and their quotes written to the delivery
+outbox, which is then drained in batches. Every chunk and batch costs the
+same fixed number of queries no matter how many users it contains.
+"""
+import logging
+from collections import Counter
+from datetime import timedelta
+from zoneinfo import ZoneInfo
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+from . import metrics, queue
+from .cache import invalidate_dashboards
+from .models import DeliveryOutbox, User, UserQuoteHistory, UserPreference, delivery_slot_for
+from .rollups import record_deliveries
+
+logger = logging.getLogger(__name__)
+
+
+def start_of_day(now):
+    return now.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def slot_window(now, minutes):
+    """The ``[first, last]`` delivery slots of the ``minutes``-wide window containing ``now``"""
+    first = (now.hour * 60 + now.minute) // minutes * minutes
+    return first, first + minutes - 1
+
+
+def due_slots(now, minutes):
+    """
+    The ``[first, last]`` slots a tick at ``now`` serves: its own window plus
+    DELIVERY_CATCH_UP_MINUTES before it, so users whose tick ran late or
+    not at all are still reached. Catch-up stops at midnight UTC, where
+    "served today" starts over.
+    """
+    first, last = slot_window(now, minutes)
+    return max(first - settings.DELIVERY_CATCH_UP_MINUTES, 0), last
+
+
+def due_users(now, minutes=60):
+    """
+    Active, unpaused users whose delivery slot is among the ``due_slots`` of
+    the tick at ``now`` and who have not been served today. Users already in
+    today's outbox (being sent, retrying or failed) are left to the outbox,
+    so catch-up ticks do not pop more of their queued quotes.
+    """
+    return User.objects.filter(
+        is_active=True,
+        delivery_slot__range=due_slots(now, minutes),
+    ).exclude(
+        preferences__delivery_paused=True
+    ).exclude(
+        outbox__delivery_date=now.date()
+    ).filter(
+        Q(last_quote_sent__isnull=True) | Q(last_quote_sent__lt=start_of_day(now))
+    ).only('id', 'username', 'email', 'telegram_chat_id', 'preferred_time', 'recent_quotes')
+
+
+def skipped_users(now, minutes=60):
+    """
+    Counts of the active users in the window that ``due_users`` leaves out:
+    ``skipped_paused`` and ``skipped_already_sent``.
+    """
+    paused = Q(preferences__delivery_paused=True)
+    return User.objects.filter(
+        is_active=True,
+        delivery_slot__range=slot_window(now, minutes),
+    ).aggregate(
+        skipped_paused=Count('id', filter=paused),
+        skipped_already_sent=Count('id', filter=~paused & Q(last_quote_sent__gte=start_of_day(now))),
+    )
+
+
+def enqueue_chunk(users, now):
+    """
+    Pick today's quote for a chunk of due users and write it to the outbox.
+
+    Returns a Counter with ``skipped``: users with no quote left or no
+    delivery channel to reach them on. Enqueueing a user who is already in
+    today's outbox is a no-op.
+    """
+    counts = Counter(skipped=0)
+    if not users:
+        return counts
+
+    with metrics.timer('quote_pick'):
+        channels = delivery_channels(users)
+        quotes = queue.pop_quotes(users)
+
+    entries = []
+    for user in users:
+        quote = quotes.get(user.id)
+        email_enabled, telegram_enabled = channels[user.id]
+        if quote is None:
+            metrics.count('no_quote_available')
+        elif not (email_enabled or telegram_enabled):
+            metrics.count('no_channel')
+        else:
+            entries.append(DeliveryOutbox(user=user, quote=quote, delivery_date=now.date(), next_attempt_at=now))
+    with metrics.timer('persist'):
+        DeliveryOutbox.objects.bulk_create(entries, ignore_conflicts=True)
+
+    counts['skipped'] = len(users) - len(entries)
+    return counts
+
+
+def delivery_channels(users):
+    """
+    ``{user_id: (email, telegram)}`` saying which channels can reach each
+    user. Users who never got preferences are created with, and served by,
+    the defaults.
+    """
+    user_ids = [user.id for user in users]
+    enabled = {
+        user_id: (email_enabled, telegram_enabled)
+        for user_id, email_enabled, telegram_enabled in UserPreference.objects.filter(
+            user_id__in=user_ids
+        ).values_list('user_id', 'email_enabled', 'telegram_enabled')
+    }
+    missing = [UserPreference(user_id=user_id) for user_id in user_ids if user_id not in enabled]
+    if missing:
+        UserPreference.objects.bulk_create(missing, ignore_conflicts=True)
+
+    channels = {}
+    for user in users:
+        email_enabled, telegram_enabled = enabled.get(user.id, (True, False))
+        channels[user.id] = (
+            bool(email_enabled and user.email),
+            bool(telegram_enabled and user.telegram_chat_id),
+        )
+    return channels
+
+
+def dispatch_outbox(now=None, batch_size=None):
+    """
+    Send due outbox entries until none are left to claim.
+
+    Each batch is claimed in a short transaction with SELECT ... FOR UPDATE
+    SKIP LOCKED, so parallel dispatchers never pick up the same entry, and
+    leased as ``sending`` for OUTBOX_LEASE_SECONDS. Sending happens outside
+    any transaction, so a crash mid-batch can only leave entries whose
+    outcome is unknown, never roll them back to pending. Failed sends are
+    retried with exponential backoff up to OUTBOX_MAX_ATTEMPTS.
+    Returns a Counter with ``sent``, ``retrying`` and ``failed``.
+    """
+    from .tasks import QuoteEmailRenderer
+
+    counts = Counter(sent=0, retrying=0, failed=0)
+    batch_size = batch_size or settings.OUTBOX_BATCH_SIZE
+    expire_leases(timezone.now())
+    # Shared by every batch, so each distinct quote is rendered once per run
+    renderer = QuoteEmailRenderer()
+    while True:
+        entries = claim_outbox_entries(now or timezone.now(), batch_size)
+        if not entries:
+            return counts
+        counts.update(send_outbox_entries(entries, timezone.now(), renderer))
+
+
+def claim_outbox_entries(now, batch_size):
+    """Lease up to ``batch_size`` due pending entries to this dispatcher"""
+    with transaction.atomic():
+        entries = list(
+            DeliveryOutbox.objects.select_for_update(skip_locked=True, of=('self',))
+            .select_related('user', 'quote__category')
+            .filter(status=DeliveryOutbox.PENDING, next_attempt_at__lte=now)
+            .order_by('next_attempt_at', 'id')[:batch_size]
+        )
+        if entries:
+            leased_until = timezone.now() + timedelta(seconds=settings.OUTBOX_LEASE_SECONDS)
+            DeliveryOutbox.objects.filter(id__in=[entry.id for entry in entries]).update(
+                status=DeliveryOutbox.SENDING, leased_until=leased_until,
+            )
+    return entries
+
+
+def expire_leases(now):
+    """
+    Mark entries whose dispatcher never recorded an outcome as ``unknown``.
+
+    The dispatcher may have died after sending, so these are left for staff
+    to check rather than sent a second time. Returns the number marked.
+    """
+    expired = DeliveryOutbox.objects.filter(status=DeliveryOutbox.SENDING, leased_until__lt=now).update(
+        status=DeliveryOutbox.UNKNOWN, last_error='Lease expired before the outcome was recorded',
+    )
+    if expired:
+        logger.warning('%d outbox entries may or may not have been delivered', expired)
+    return expired
+
+
+def release_leases(entries):
+    """Put leased ``entries`` back to pending, e.g. when their batch failed before sending"""
+    DeliveryOutbox.objects.filter(id__in=[entry.id for entry in entries], status=DeliveryOutbox.SENDING).update(
+        status=DeliveryOutbox.PENDING, leased_until=None,
+    )
+
+
+def send_outbox_entries(entries, now, renderer=None):
+    """Send a leased batch of outbox entries and record the outcome of each"""
+    from .tasks import send_quote_emails, send_quote_telegrams
+
+    users = [entry.user for entry in entries]
+    try:
+        channels = delivery_channels(users)
+    except Exception:
+        # Nothing was sent yet, so the batch can safely go back to the queue
+        release_leases(entries)
+        raise
+    email_entries = []
+    telegram_entries = []
+    for entry in entries:
+        email_enabled, telegram_enabled = channels[entry.user_id]
+        if email_enabled:
+            email_entries.append(entry)
+        if telegram_enabled:
+            telegram_entries.append(entry)
+
+    # A channel failing as a whole counts as a failed attempt for each of its entries
+    try:
+        email_errors = send_quote_emails([(entry.user, entry.quote) for entry in email_entries], renderer)
+    except Exception as e:
+        logger.exception('Email delivery failed')
+        email_errors = [f'Email delivery failed: {e}'] * len(email_entries)
+    try:
+        telegram_results = send_quote_telegrams([(entry.user, entry.quote) for entry in telegram_entries])
+    except Exception:
+        logger.exception('Telegram delivery failed')
+        telegram_results = [False] * len(telegram_entries)
+    # An entry counts as delivered once any of its channels succeeded
+    delivered = {entry.id for entry, error in zip(email_entries, email_errors) if error is None}
+    delivered |= {entry.id for entry, ok in zip(telegram_entries, telegram_results) if ok}
+    errors = {entry.id: error for entry, error in zip(email_entries, email_errors) if error is not None}
+
+    counts = Counter(sent=0, retrying=0, failed=0)
+    history = []
+    for entry in entries:
+        entry.attempts += 1
+        entry.leased_until = None
+        if entry.id in delivered:
+            entry.status = DeliveryOutbox.SENT
+            entry.sent_at = now
+            entry.last_error = ''
+            entry.user.last_quote_sent = now
+            entry.user.remember_quote(entry.quote_id, now)
+            history.append(UserQuoteHistory(user=entry.user, quote=entry.quote))
+            counts['sent'] += 1
+        else:
+            entry.last_error = errors.get(entry.id, 'No delivery channel accepted the quote')
+            if entry.attempts >= settings.OUTBOX_MAX_ATTEMPTS:
+                entry.status = DeliveryOutbox.FAILED
+                counts['failed'] += 1
+            else:
+                entry.status = DeliveryOutbox.PENDING
+                delay = settings.OUTBOX_RETRY_BASE_SECONDS * 2 ** (entry.attempts - 1)
+                entry.next_attempt_at = now + timedelta(seconds=delay)
+                counts['retrying'] += 1
+
+    with metrics.timer('persist'), transaction.atomic():
+        DeliveryOutbox.objects.bulk_update(
+            entries, ['status', 'attempts', 'next_attempt_at', 'leased_until', 'last_error', 'sent_at']
+        )
+        if history:
+            UserQuoteHistory.objects.bulk_create(history)
+            User.objects.bulk_update(
+                [record.user for record in history],
+                ['last_quote_sent', 'recent_quotes'],
+            )
+            record_deliveries(history)
+    if history:
+        invalidate_dashboards([record.user_id for record in history])
+    for outcome, amount in counts.items():
+        metrics.count(outcome, amount)
+    return counts
+
+
+def deliver_chunk(users, now):
+    """
+    Enqueue today's quote for a chunk of due users, then drain the outbox.
+
+    Returns a Counter with ``sent``, ``skipped``, ``retrying`` and ``failed``.
+    """
+    counts = Counter(sent=0, skipped=0, retrying=0, failed=0)
+    counts['skipped'] = enqueue_chunk(users, now)['skipped']
+    counts.update(dispatch_outbox(now))
+    return counts
+
+
+def due_user_ranges(now, minutes, chunk_size):
+    """
+    Split the due cohort into ``(first_id, last_id)`` ranges of at most
+    ``chunk_size`` users each, so chunk tasks only carry two integers.
+    """
+    ranges = []
+    chunk = []
+    for user_id in due_users(now, minutes).order_by('id').values_list('id', flat=True).iterator(chunk_size=chunk_size):
+        chunk.append(user_id)
+        if len(chunk) == chunk_size:
+            ranges.append((chunk[0], chunk[-1]))
+            chunk = []
+    if chunk:
+        ranges.append((chunk[0], chunk[-1]))
+    return ranges
+
+
+def slot_load(minutes):
+    """
+    Number of deliverable users falling in each ``minutes``-wide tick of the
+    day, as a list indexed by tick.
+    """
+    load = [0] * (1440 // minutes)
+    rows = User.objects.filter(is_active=True).exclude(
+        preferences__delivery_paused=True
+    ).values('delivery_slot').annotate(users=Count('id')).order_by()
+    for row in rows:
+        load[row['delivery_slot'] // minutes] += row['users']
+    return load
+
+
+def zones_changing_offset(now, hours=25):
+    """
+    Time zones in use whose UTC offset differs between any of ``now`` and
+    ``hours`` either side of it, i.e. whose users' slots are moving.
+
+    The window has to cover a full day each way: a slot follows the user's
+    next delivery, which crosses the transition up to a day after it.
+    """
+    instants = (now - timedelta(hours=hours), now, now + timedelta(hours=hours))
+    zones = []
+    for name in User.objects.exclude(timezone='UTC').values_list('timezone', flat=True).distinct().order_by():
+        zone = ZoneInfo(name)
+        if len({instant.astimezone(zone).utcoffset() for instant in instants}) > 1:
+            zones.append(name)
+    return zones
+
+
+def recompute_delivery_slots(zones=None, now=None, batch_size=1000):
+    """
+    Recompute the delivery slot of every user, or of the users in ``zones``,
+    writing only the slots that changed ``batch_size`` users at a time.
+    Returns the number of users updated.
+    """
+    now = now or timezone.now()
+    users = User.objects.order_by('id').only('id', 'username', 'preferred_time', 'timezone', 'delivery_slot')
+    if zones is not None:
+        users = users.filter(timezone__in=zones)
+
+    changed = []
+    updated = 0
+    for user in users.iterator(chunk_size=batch_size):
+        slot = delivery_slot_for(user.preferred_time, user.username, user.timezone, now)
+        if slot != user.delivery_slot:
+            user.delivery_slot = slot
+            changed.append(user)
+        if len(changed) == batch_size:
+            User.objects.bulk_update(changed, ['delivery_slot'])
+            updated += len(changed)
+            changed = []
+    if changed:
+        User.objects.bulk_update(changed, ['delivery_slot'])
+        updated += len(changed)
+    return updated
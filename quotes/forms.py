@@ -1,6 +1,8 @@
 from django import forms
 from django.contrib.auth.forms import UserCreationForm, PasswordResetForm
-from .models import User, UserPreference, Category
+from . import catalog, queue
+from .models import User, UserPreference, Category, Quote, timezone_names
+from .normalization import content_hash
 
 
 class UserRegistrationForm(UserCreationForm):
@@ -40,31 +42,65 @@ class UserPreferenceForm(forms.ModelForm):
             'type': 'time',
             'class': 'form-control'
         }),
-        help_text='Select your preferred time to receive quotes (UTC)'
+        help_text='Select your preferred time to receive quotes, in your time zone'
+    )
+    timezone = forms.ChoiceField(
+        required=False,
+        initial='UTC',
+        widget=forms.Select(attrs={'class': 'form-select'}),
+        help_text='Daylight saving changes are followed automatically'
+    )
+    telegram_chat_id = forms.IntegerField(
+        required=False,
+        widget=forms.NumberInput(attrs={
+            'class': 'form-control',
+            'placeholder': 'Telegram chat ID'
+        }),
+        help_text='The chat our bot should send your quotes to'
     )
 
     class Meta:
         model = UserPreference
-        fields = ['preferred_categories', 'delivery_paused']
+        fields = ['preferred_categories', 'delivery_paused', 'email_enabled', 'telegram_enabled']
         widgets = {
             'preferred_categories': forms.CheckboxSelectMultiple(),
             'delivery_paused': forms.CheckboxInput(attrs={'class': 'form-check-input'}),
+            'email_enabled': forms.CheckboxInput(attrs={'class': 'form-check-input'}),
+            'telegram_enabled': forms.CheckboxInput(attrs={'class': 'form-check-input'}),
         }
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
+        # Render the checkboxes from the cached catalog; submitted IDs are still validated against the table
+        self.fields['preferred_categories'].choices = [
+            (category.id, category.name) for category in catalog.categories()
+        ]
+        self.fields['timezone'].choices = [(name, name) for name in sorted(timezone_names())]
         if self.instance and self.instance.user:
             self.initial['preferred_time'] = self.instance.user.preferred_time
+            self.initial['timezone'] = self.instance.user.timezone
+            self.initial['telegram_chat_id'] = self.instance.user.telegram_chat_id
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if cleaned_data.get('telegram_enabled') and not cleaned_data.get('telegram_chat_id'):
+            self.add_error('telegram_chat_id', 'Enter your Telegram chat ID to receive quotes on Telegram.')
+        return cleaned_data
 
     def save(self, commit=True):
         preference = super().save(commit=False)
         if 'preferred_time' in self.cleaned_data:
             preference.user.preferred_time = self.cleaned_data['preferred_time']
+            preference.user.timezone = self.cleaned_data.get('timezone') or preference.user.timezone
+            preference.user.telegram_chat_id = self.cleaned_data.get('telegram_chat_id')
             if commit:
                 preference.user.save()
         if commit:
             preference.save()
             self.save_m2m()
+            if 'preferred_categories' in self.changed_data:
+                # Quotes queued for the old categories no longer apply
+                queue.rebuild_queue(preference.user)
         return preference
 
 
@@ -76,3 +112,25 @@ class CustomPasswordResetForm(PasswordResetForm):
             'placeholder': 'Enter your email address'
         })
     )
+
+
+class QuoteAdminForm(forms.ModelForm):
+    """Admin quote form that rejects text matching an existing quote's content hash"""
+
+    class Meta:
+        model = Quote
+        fields = '__all__'
+
+    def clean(self):
+        cleaned_data = super().clean()
+        text = cleaned_data.get('text', self.instance.text)
+        # Existing quotes are only checked when their text changes, so duplicates
+        # that predate content_hash can still be edited or deactivated
+        if text and (self.instance._state.adding or 'text' in self.changed_data):
+            duplicate = Quote.objects.filter(content_hash=content_hash(text)).exclude(pk=self.instance.pk).first()
+            if duplicate:
+                self.add_error(
+                    'text' if 'text' in self.fields else None,
+                    f'This quote duplicates quote #{duplicate.pk} by {duplicate.author}.',
+                )
+        return cleaned_data
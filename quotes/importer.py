@@ -0,0 +1,153 @@
+"""
+Streaming bulk import of quotes.
+
+Rows are read lazily from CSV or JSONL and written in fixed-size batches,
+one transaction per batch, so an import holds one batch of rows in memory
+whatever the size of its input. Quotes are deduplicated on
+``Quote.content_hash`` with one indexed lookup per batch, and unknown
+categories are created as they appear.
+"""
+import csv
+import json
+import time
+from collections import Counter
+
+from django.db import IntegrityError, transaction
+from django.utils.text import slugify
+from . import catalog
+from .models import Category, Quote
+from .normalization import content_hash
+from .sampler import sampler
+
+FORMATS = ('csv', 'jsonl')
+
+
+def read_rows(stream, format, on_error=None):
+    """
+    Yield ``{'text', 'author', 'category'}`` dicts from a CSV or JSONL text
+    stream. JSONL lines that are not JSON objects are passed to
+    ``on_error(line_number, message)`` and yielded as empty (invalid) rows.
+    """
+    if format == 'csv':
+        yield from csv.DictReader(stream)
+    elif format == 'jsonl':
+        for number, line in enumerate(stream, 1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                row, error = None, f'not valid JSON ({e})'
+            else:
+                error = f'expected a JSON object, got {type(row).__name__}'
+            if not isinstance(row, dict):
+                if on_error:
+                    on_error(number, error)
+                row = {}
+            yield row
+    else:
+        raise ValueError(f'Unknown quote format {format!r}; expected one of {", ".join(FORMATS)}')
+
+
+class QuoteImporter:
+    """
+    Writes quote rows in batches of ``batch_size``, calling ``progress`` with
+    the running counts and the rows/sec rate after every batch.
+    """
+
+    def __init__(self, batch_size=1000, progress=None):
+        self.batch_size = batch_size
+        self.progress = progress
+        self.counts = Counter(read=0, created=0, duplicates=0, invalid=0)
+        self.categories = {}
+
+    def run(self, rows):
+        """Import ``rows`` and return the Counter of rows read, created, duplicated and invalid"""
+        self.started = time.monotonic()
+        self.categories = {category.name: category.id for category in catalog.categories()}
+
+        batch = []
+        for row in rows:
+            self.counts['read'] += 1
+            batch.append(row)
+            if len(batch) == self.batch_size:
+                self.write(batch)
+                batch = []
+        if batch:
+            self.write(batch)
+
+        catalog.invalidate()
+        sampler.invalidate()
+        return self.counts
+
+    def write(self, rows):
+        quotes = {}
+        for row in rows:
+            text = (row.get('text') or '').strip()
+            category = (row.get('category') or '').strip()
+            if not text or not category:
+                self.counts['invalid'] += 1
+                continue
+            digest = content_hash(text)
+            if digest in quotes:
+                self.counts['duplicates'] += 1
+                continue
+            quotes[digest] = (text, (row.get('author') or '').strip() or 'Unknown', category)
+
+        with transaction.atomic():
+            for digest in Quote.objects.filter(content_hash__in=quotes).values_list('content_hash', flat=True):
+                del quotes[digest]
+                self.counts['duplicates'] += 1
+            self.create_categories({category for _, _, category in quotes.values()})
+            self.insert(quotes)
+        self.counts['created'] += len(quotes)
+
+        if self.progress:
+            elapsed = time.monotonic() - self.started
+            self.progress(self.counts, self.counts['read'] / elapsed if elapsed else 0.0)
+
+    def insert(self, quotes):
+        """
+        Insert ``quotes``, dropping (and counting as duplicates) any that a
+        concurrent import stored since the lookup, so ``quotes`` ends up
+        holding exactly the quotes created.
+        """
+        while quotes:
+            try:
+                with transaction.atomic():
+                    Quote.objects.bulk_create([
+                        Quote(text=text, author=author[:200], category_id=self.categories[category], content_hash=digest)
+                        for digest, (text, author, category) in quotes.items()
+                    ])
+                return
+            except IntegrityError:
+                stored = set(Quote.objects.filter(content_hash__in=quotes).values_list('content_hash', flat=True))
+                if not stored:
+                    raise
+                for digest in stored:
+                    del quotes[digest]
+                    self.counts['duplicates'] += 1
+
+    def create_categories(self, names):
+        """Map each of ``names`` to a category ID, creating the categories not seen yet"""
+        # Rows are matched on the (truncated) name; slugs only have to be unique
+        missing = {name: name[:100] for name in names if name not in self.categories}
+        if not missing:
+            return
+        existing = dict(Category.objects.filter(name__in=missing.values()).values_list('name', 'id'))
+        for name, stored in missing.items():
+            if stored not in existing:
+                category, _ = Category.objects.get_or_create(name=stored, defaults={'slug': unique_slug(stored)})
+                existing[stored] = category.id
+            self.categories[name] = existing[stored]
+
+
+def unique_slug(name):
+    """A slug for ``name`` no category holds yet; names without slug characters get a numbered fallback"""
+    base = slugify(name, allow_unicode=True)[:90] or 'category'
+    slug = base
+    suffix = 1
+    while Category.objects.filter(slug=slug).exists():
+        suffix += 1
+        slug = f'{base}-{suffix}'
+    return slug
@@ -0,0 +1,47 @@
+from datetime import timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from quotes.models import REPEAT_WINDOW_DAYS, ArchivedQuoteHistory, UserQuoteHistory
+
+
+class Command(BaseCommand):
+    help = 'Move UserQuoteHistory rows older than the archive horizon into the cold archive table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.QUOTE_HISTORY_ARCHIVE_DAYS,
+                            help='Archive rows sent more than this many days ago')
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help='Rows moved per transaction')
+
+    def handle(self, *args, **options):
+        days = options['days']
+        if days <= REPEAT_WINDOW_DAYS:
+            raise CommandError(f'--days must be greater than the {REPEAT_WINDOW_DAYS}-day repeat window')
+
+        cutoff = timezone.now() - timedelta(days=days)
+        # Favorites stay in the hot table so the favorites pages keep working
+        old_rows = UserQuoteHistory.objects.filter(sent_at__lt=cutoff, is_favorite=False).order_by('id')
+
+        moved = 0
+        while True:
+            with transaction.atomic():
+                rows = list(old_rows.values('id', 'user_id', 'quote_id', 'sent_at', 'is_favorite')[:options['batch_size']])
+                if not rows:
+                    break
+                ArchivedQuoteHistory.objects.bulk_create([
+                    ArchivedQuoteHistory(
+                        user_id=row['user_id'],
+                        quote_id=row['quote_id'],
+                        sent_at=row['sent_at'],
+                        is_favorite=row['is_favorite'],
+                    )
+                    for row in rows
+                ])
+                # Archived rows are far outside the repeat window, so recent_quotes is left alone
+                UserQuoteHistory.objects.filter(id__in=[row['id'] for row in rows]).delete()
+            moved += len(rows)
+            self.stdout.write(f'Archived {moved} rows...')
+
+        self.stdout.write(self.style.SUCCESS(f'Archived {moved} history rows older than {days} days'))
@@ -0,0 +1,134 @@
+import random
+import statistics
+import threading
+import time
+from collections import Counter
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connection, transaction
+from django.utils import timezone
+from quotes.benchmarks import seed_categories, seed_quotes, seed_users
+from quotes.models import Category, Quote, User, UserQuoteHistory
+
+
+class Command(BaseCommand):
+    help = ('Run delivery-style writer threads against dashboard-style reader threads and report '
+            'throughput and lock errors; on SQLite the pre-WAL setup is measured too')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--writers', type=int, default=4,
+                            help='Concurrent writers, like Celery worker processes')
+        parser.add_argument('--readers', type=int, default=4,
+                            help='Concurrent readers, like gunicorn threads')
+        parser.add_argument('--seconds', type=float, default=5)
+        parser.add_argument('--batch', type=int, default=50,
+                            help='Users served per write transaction')
+
+    def handle(self, *args, **options):
+        # The seed has to be committed so the other connections can see it
+        categories = seed_categories(2)
+        seed_quotes(200, categories)
+        quote_ids = list(Quote.objects.filter(category__in=categories).values_list('id', flat=True))
+        user_ids = seed_users(options['writers'] * options['batch'] * 20)
+        try:
+            self.stdout.write(f'{"setup":<28} {"commits/s":>10} {"locked":>8} {"reads/s":>10} {"read p95 ms":>12}')
+            if connection.vendor == 'sqlite':
+                self.run('sqlite rollback journal', user_ids, quote_ids, options, legacy=True)
+                self.run('sqlite WAL + IMMEDIATE', user_ids, quote_ids, options)
+            else:
+                self.run(connection.vendor, user_ids, quote_ids, options)
+        finally:
+            history = UserQuoteHistory.objects.filter(user_id__in=user_ids)
+            history._raw_delete(history.db)
+            for queryset in (User.objects.filter(id__in=user_ids), Quote.objects.filter(id__in=quote_ids),
+                             Category.objects.filter(id__in=[category.id for category in categories])):
+                queryset._raw_delete(queryset.db)
+
+    def run(self, label, user_ids, quote_ids, options, legacy=False):
+        """Run the writers and readers for the configured time and print one result line"""
+        connection.close()
+        if legacy:
+            # Django's defaults before this setup: rollback journal, deferred BEGIN, 5s busy timeout
+            connection.pragmas = ()
+            with connection.cursor() as cursor:
+                cursor.execute('PRAGMA journal_mode=DELETE')
+            connection.close()
+
+        counts = Counter(commits=0, locked=0, reads=0)
+        latencies = []
+        lock = threading.Lock()
+        deadline = time.monotonic() + options['seconds']
+        chunks = [user_ids[i::options['writers']] for i in range(options['writers'])]
+
+        def connect():
+            if legacy:
+                connection.pragmas = ()
+            connection.ensure_connection()
+            if legacy:
+                connection.transaction_mode = 'DEFERRED'
+                with connection.cursor() as cursor:
+                    cursor.execute('PRAGMA busy_timeout=5000')
+
+        def writer(chunk):
+            connect()
+            rng = random.Random()
+            try:
+                while time.monotonic() < deadline:
+                    batch = rng.sample(chunk, options['batch'])
+                    now = timezone.now()
+                    try:
+                        # The shape of a delivery batch: read the users, record history, stamp the users
+                        with transaction.atomic():
+                            users = list(User.objects.filter(id__in=batch).only('id', 'last_quote_sent'))
+                            UserQuoteHistory.objects.bulk_create([
+                                UserQuoteHistory(user_id=user.id, quote_id=rng.choice(quote_ids)) for user in users
+                            ])
+                            for user in users:
+                                user.last_quote_sent = now
+                            User.objects.bulk_update(users, ['last_quote_sent'])
+                        outcome = 'commits'
+                    except OperationalError:
+                        outcome = 'locked'
+                    with lock:
+                        counts[outcome] += 1
+            finally:
+                connection.close()
+
+        def reader():
+            connect()
+            rng = random.Random()
+            try:
+                while time.monotonic() < deadline:
+                    started = time.perf_counter()
+                    try:
+                        list(UserQuoteHistory.objects.filter(user_id=rng.choice(user_ids))[:10])
+                        UserQuoteHistory.objects.filter(user_id=rng.choice(user_ids)).count()
+                    except OperationalError:
+                        with lock:
+                            counts['locked'] += 1
+                        continue
+                    with lock:
+                        counts['reads'] += 1
+                        latencies.append((time.perf_counter() - started) * 1000)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=writer, args=(chunk,)) for chunk in chunks]
+        threads += [threading.Thread(target=reader) for _ in range(options['readers'])]
+        started = time.monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.monotonic() - started
+
+        if legacy:
+            del connection.pragmas
+            connection.close()
+            with connection.cursor() as cursor:
+                cursor.execute('PRAGMA journal_mode=WAL')
+
+        p95 = statistics.quantiles(latencies, n=20)[-1] if len(latencies) > 1 else 0.0
+        self.stdout.write(
+            f'{label:<28} {counts["commits"] / elapsed:>10.1f} {counts["locked"]:>8} '
+            f'{counts["reads"] / elapsed:>10.1f} {p95:>12.2f}'
+        )
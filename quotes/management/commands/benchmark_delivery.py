@@ -0,0 +1,206 @@
+import json
+import statistics
+import time
+from datetime import time as time_of_day, timedelta
+from django.core import mail
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from quotes import catalog, metrics, queue
+from quotes.benchmarks import (
+    peak_rss_mb, rolled_back, seed_categories, seed_history, seed_preferences, seed_quotes, seed_users,
+)
+from quotes.models import Quote, User, UserQuoteHistory
+from quotes.rollups import reconcile
+from quotes.sampler import sampler
+from quotes.tasks import send_daily_quotes
+
+VIEWS = {
+    'dashboard': 'dashboard',
+    'history': 'quote_history',
+    'favorites': 'favorites',
+    'analytics': 'admin_analytics',
+}
+
+# Reported as relative change against --baseline
+COMPARED = [
+    ('delivery', 'seconds'), ('delivery', 'queries'), ('delivery', 'emails_per_sec'),
+    *((f'views.{name}', 'p50_ms') for name in VIEWS),
+]
+
+
+class Command(BaseCommand):
+    help = ('Seed users, quotes and history, run the daily delivery against the in-memory email backend '
+            'and load-test the main views; results can be written to JSON and compared between runs')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=2000,
+                            help='Users due for delivery')
+        parser.add_argument('--quotes', type=int, default=5000)
+        parser.add_argument('--categories', type=int, default=10)
+        parser.add_argument('--days', type=int, default=30,
+                            help='Days of history seeded per user')
+        parser.add_argument('--popular-share', type=float, default=0.8,
+                            help='Share of users whose preferences are one of five popular category sets')
+        parser.add_argument('--requests', type=int, default=50,
+                            help='Requests made to each view')
+        parser.add_argument('--queued', action='store_true',
+                            help='Fill the next-quote queues before delivering, as the off-peak job would')
+        parser.add_argument('--output', help='Write the results to this JSON file')
+        parser.add_argument('--baseline', help='JSON file from an earlier run to compare against')
+
+    def handle(self, *args, **options):
+        results = {
+            'started_at': timezone.now().isoformat(),
+            'database': connection.vendor,
+            'parameters': {
+                name: options[name]
+                for name in ('users', 'quotes', 'categories', 'days', 'popular_share', 'requests', 'queued')
+            },
+        }
+        # A private cache keeps benchmark rows out of the shared catalog, dashboards and metrics
+        with override_settings(
+            CACHES={'default': {
+                'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                'LOCATION': 'benchmark',
+                # Large enough that catalog entries never cull the metrics counters
+                'OPTIONS': {'MAX_ENTRIES': 1_000_000},
+            }},
+            EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+            CELERY_TASK_ALWAYS_EAGER=True,
+            ALLOWED_HOSTS=['testserver'],
+        ), rolled_back():
+            try:
+                results['seed'] = self.seed(options)
+                results['delivery'] = self.deliver()
+                results['views'] = self.load_views(options['requests'])
+            finally:
+                catalog.local.clear()
+                sampler.invalidate()
+
+        self.report(results)
+        if options['baseline']:
+            with open(options['baseline']) as f:
+                self.compare(json.load(f), results)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(results, f, indent=2)
+            self.stdout.write(f'Results written to {options["output"]}')
+
+    def seed(self, options):
+        started = time.perf_counter()
+        now = timezone.now()
+        categories = seed_categories(options['categories'])
+        seed_quotes(options['quotes'], categories)
+        quote_ids = list(Quote.objects.filter(category__in=categories).values_list('id', flat=True))
+
+        # Everyone is due in the current tick and was last served yesterday
+        self.user_ids = seed_users(
+            options['users'],
+            preferred_time=time_of_day(now.hour, now.minute),
+            delivery_slot=now.hour * 60 + now.minute,
+            last_quote_sent=now - timedelta(days=1),
+        )
+        seed_preferences(self.user_ids, categories, popular_share=options['popular_share'])
+        seed_history(self.user_ids, quote_ids, options['days'], now - timedelta(days=1))
+        for start in range(0, len(self.user_ids), 1000):
+            recent = UserQuoteHistory.recent_quotes_for_users(self.user_ids[start:start + 1000])
+            User.objects.bulk_update(
+                [User(id=user_id, recent_quotes=quotes) for user_id, quotes in recent.items()], ['recent_quotes']
+            )
+        reconcile()
+        catalog.invalidate()
+        sampler.invalidate()
+        seeded = {
+            'seconds': round(time.perf_counter() - started, 3),
+            'history_rows': len(self.user_ids) * options['days'],
+        }
+        if options['queued']:
+            started = time.perf_counter()
+            queue.refill_queues()
+            seeded['queue_refill_seconds'] = round(time.perf_counter() - started, 3)
+        return seeded
+
+    def deliver(self):
+        mail.outbox = []
+        metrics.reset()
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            send_daily_quotes()
+            elapsed = time.perf_counter() - started
+        emails = len(mail.outbox)
+        since = timezone.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        distinct_quotes = UserQuoteHistory.objects.filter(
+            user_id__in=self.user_ids, sent_at__gte=since
+        ).values('quote_id').distinct().count()
+        return {
+            'seconds': round(elapsed, 3),
+            'emails': emails,
+            'emails_per_sec': round(emails / elapsed, 1),
+            'queries': len(queries),
+            'distinct_quotes': distinct_quotes,
+            'peak_rss_mb': round(peak_rss_mb(), 1),
+            'stage_seconds': {stage: round(seconds, 3) for stage, seconds in metrics.stage_seconds().items()},
+        }
+
+    def load_views(self, requests):
+        user = User.objects.get(id=self.user_ids[len(self.user_ids) // 2])
+        staff = User.objects.create(username=f'bench-staff-{user.id}', is_staff=True)
+        results = {}
+        for name, url_name in VIEWS.items():
+            client = Client()
+            client.force_login(staff if name == 'analytics' else user)
+            url = reverse(url_name)
+            durations = []
+            query_counts = []
+            for _ in range(requests):
+                with CaptureQueriesContext(connection) as queries:
+                    started = time.perf_counter()
+                    response = client.get(url)
+                    durations.append((time.perf_counter() - started) * 1000)
+                if response.status_code != 200:
+                    raise RuntimeError(f'{url} answered {response.status_code}')
+                query_counts.append(len(queries))
+            results[name] = {
+                'p50_ms': round(statistics.median(durations), 2),
+                'p95_ms': round(statistics.quantiles(durations, n=20)[-1], 2) if requests > 1 else round(durations[0], 2),
+                'first_ms': round(durations[0], 2),
+                'queries': max(query_counts),
+            }
+        results['peak_rss_mb'] = round(peak_rss_mb(), 1)
+        return results
+
+    def report(self, results):
+        seed = results['seed']
+        delivery = results['delivery']
+        self.stdout.write(f'Seeded {results["parameters"]["users"]} users and {seed["history_rows"]} history rows '
+                          f'in {seed["seconds"]:.1f}s')
+        self.stdout.write(
+            f'Delivery: {delivery["emails"]} emails in {delivery["seconds"]:.2f}s '
+            f'({delivery["emails_per_sec"]:.0f}/s), {delivery["distinct_quotes"]} distinct quotes, {delivery["queries"]} queries, '
+            f'peak RSS {delivery["peak_rss_mb"]:.0f} MB'
+        )
+        self.stdout.write('Stages: ' + ', '.join(
+            f'{stage} {seconds:.2f}s' for stage, seconds in delivery['stage_seconds'].items()
+        ))
+        self.stdout.write(f'{"view":<12} {"first ms":>10} {"p50 ms":>10} {"p95 ms":>10} {"queries":>8}')
+        for name in VIEWS:
+            view = results['views'][name]
+            self.stdout.write(
+                f'{name:<12} {view["first_ms"]:>10.2f} {view["p50_ms"]:>10.2f} {view["p95_ms"]:>10.2f} {view["queries"]:>8}'
+            )
+
+    def compare(self, baseline, results):
+        self.stdout.write('Change against baseline:')
+        for section, field in COMPARED:
+            before, after = baseline, results
+            for part in section.split('.'):
+                before = before.get(part, {})
+                after = after[part]
+            if not before.get(field):
+                continue
+            change = (after[field] - before[field]) / before[field] * 100
+            self.stdout.write(f'  {section + " " + field:<28} {before[field]:>10} -> {after[field]:<10} ({change:+.1f}%)')
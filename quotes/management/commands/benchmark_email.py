@@ -0,0 +1,44 @@
+import time
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+from quotes.benchmarks import StubEmailBackend
+from quotes.models import Category, Quote, User
+from quotes.tasks import send_quote_email, send_quote_emails
+
+
+class Command(BaseCommand):
+    help = ('Measure quote email throughput per worker against a stub backend, a connection per email '
+            'vs one shared connection')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--emails', type=int, default=1000)
+        parser.add_argument('--connect-ms', type=float, default=50,
+                            help='Simulated cost of opening a provider connection')
+        parser.add_argument('--request-ms', type=float, default=5,
+                            help='Simulated cost of one provider request, made per message')
+
+    def handle(self, *args, **options):
+        StubEmailBackend.connect_latency = options['connect_ms'] / 1000
+        StubEmailBackend.request_latency = options['request_ms'] / 1000
+
+        category = Category(name='Benchmark')
+        quote = Quote(text='The only way to do great work is to love what you do.', author='Steve Jobs', category=category)
+        deliveries = [
+            (User(username=f'bench{i}', email=f'bench{i}@example.com'), quote)
+            for i in range(options['emails'])
+        ]
+
+        with override_settings(EMAIL_BACKEND='quotes.benchmarks.StubEmailBackend'):
+            started = time.perf_counter()
+            for user, quote in deliveries:
+                send_quote_email(user, quote)
+            per_email = time.perf_counter() - started
+
+            started = time.perf_counter()
+            send_quote_emails(deliveries)
+            shared = time.perf_counter() - started
+
+        count = len(deliveries)
+        self.stdout.write(f'{"path":<20} {"seconds":>10} {"emails/sec":>12}')
+        self.stdout.write(f'{"one send per email":<20} {per_email:>10.2f} {count / per_email:>12.1f}')
+        self.stdout.write(f'{"shared connection":<20} {shared:>10.2f} {count / shared:>12.1f}')
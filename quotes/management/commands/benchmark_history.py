@@ -0,0 +1,50 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.utils import timezone
+from quotes.benchmarks import rolled_back, seed_categories, seed_history, seed_quotes, seed_users, time_calls
+from quotes.models import Quote, UserQuoteHistory
+
+HISTORY_INDEXES = ['quotes_uqh_user_sent_idx', 'quotes_uqh_user_fav_idx', 'quotes_uqh_sent_idx']
+
+
+class Command(BaseCommand):
+    help = 'Time the hot UserQuoteHistory queries on a seeded table, with and without the access-path indexes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10000)
+        parser.add_argument('--days', type=int, default=100,
+                            help='History rows seeded per user')
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--without-indexes', action='store_true',
+                            help='Drop the history indexes first to get baseline numbers')
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        with rolled_back():
+            categories = seed_categories(5)
+            seed_quotes(1000, categories)
+            quote_ids = list(Quote.objects.filter(category__in=categories).values_list('id', flat=True))
+            user_ids = seed_users(options['users'])
+            seed_history(user_ids, quote_ids, options['days'], now)
+            self.stdout.write(f'Seeded {len(user_ids) * options["days"]} history rows')
+
+            if options['without_indexes']:
+                with connection.cursor() as cursor:
+                    for name in HISTORY_INDEXES:
+                        cursor.execute(f'DROP INDEX {name}')
+            with connection.cursor() as cursor:
+                cursor.execute(f'ANALYZE {UserQuoteHistory._meta.db_table}')
+
+            user_id = user_ids[len(user_ids) // 2]
+            since = now - timedelta(days=30)
+            queries = {
+                'recent window': lambda: list(UserQuoteHistory.objects.filter(
+                    user_id=user_id, sent_at__gte=since).values_list('quote_id', flat=True)),
+                'user history page': lambda: list(UserQuoteHistory.objects.filter(user_id=user_id)[:20]),
+                'user favorites': lambda: list(UserQuoteHistory.objects.filter(
+                    user_id=user_id, is_favorite=True)[:20]),
+                'latest deliveries': lambda: list(UserQuoteHistory.objects.all()[:10]),
+            }
+            for label, query in queries.items():
+                self.stdout.write(f'{label:<20} {time_calls(query, options["repeat"]):>10.3f} ms')
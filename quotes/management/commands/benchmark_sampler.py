@@ -0,0 +1,56 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from quotes import catalog
+from quotes.benchmarks import rolled_back, seed_categories, seed_quotes, time_calls
+from quotes.models import Quote, User, UserPreference, UserQuoteHistory
+from quotes.sampler import sampler
+
+
+def order_by_random_pick(user):
+    """The previous selection path: exclude recent quotes, then ORDER BY RANDOM()"""
+    thirty_days_ago = timezone.now() - timedelta(days=30)
+    user_categories = user.preferences.preferred_categories.all()
+    recent_quote_ids = UserQuoteHistory.objects.filter(
+        user=user,
+        sent_at__gte=thirty_days_ago
+    ).values_list('quote_id', flat=True)
+    return Quote.objects.filter(
+        is_active=True, category__in=user_categories
+    ).exclude(id__in=recent_quote_ids).order_by('?').first()
+
+
+class Command(BaseCommand):
+    help = 'Compare the in-memory quote sampler against ORDER BY RANDOM() selection'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', nargs='+', type=int, default=[10000, 100000, 1000000],
+                            help='Quote table sizes to benchmark')
+        parser.add_argument('--draws', type=int, default=20,
+                            help='Selections timed per path and size')
+
+    def handle(self, *args, **options):
+        self.stdout.write(f'{"quotes":>10} {"ORDER BY RANDOM() ms":>22} {"sampler ms":>12} {"pool load ms":>14}')
+        for size in options['sizes']:
+            with rolled_back():
+                categories = seed_categories(5)
+                seed_quotes(size, categories)
+
+                user = User.objects.create(username=f'bench-sampler-{size}')
+                preferences = UserPreference.objects.create(user=user)
+                preferences.preferred_categories.set(categories[:2])
+                recent = Quote.objects.filter(category__in=categories[:2]).values_list('id', flat=True)[:30]
+                UserQuoteHistory.objects.bulk_create([
+                    UserQuoteHistory(user=user, quote_id=quote_id) for quote_id in recent
+                ])
+
+                catalog.invalidate()
+                sampler.invalidate()
+                load_ms = time_calls(sampler.load, 1)
+                sampler.pools()
+                legacy_ms = time_calls(lambda: order_by_random_pick(user), options['draws'])
+                sampler_ms = time_calls(lambda: UserQuoteHistory.get_unsent_quote_for_user(user), options['draws'])
+
+            catalog.invalidate()
+            sampler.invalidate()
+            self.stdout.write(f'{size:>10} {legacy_ms:>22.2f} {sampler_ms:>12.2f} {load_ms:>14.2f}')
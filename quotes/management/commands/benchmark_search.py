@@ -0,0 +1,37 @@
+from itertools import islice
+from django.core.management.base import BaseCommand
+from django.db import connection
+from quotes import search
+from quotes.benchmarks import rolled_back, seed_categories, seed_quotes, sentences, time_calls
+from quotes.models import Quote
+
+
+class Command(BaseCommand):
+    help = 'Time full-text quote search against LIKE scans on a seeded quote table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--quotes', type=int, default=1000000)
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        with rolled_back():
+            categories = seed_categories(5)
+            seed_quotes(options['quotes'], categories, texts=sentences())
+            self.stdout.write(f'Seeded {options["quotes"]} quotes on {connection.vendor}')
+
+            # The most frequent, a mid-frequency and the rarest word of the seeded vocabulary, then two words
+            words = next(sentences()).rstrip('.').lower().split()
+            vocabulary = list(dict.fromkeys(
+                word for sentence in islice(sentences(), 5000) for word in sentence.rstrip('.').lower().split()
+            ))
+            frequent, middle, rare = vocabulary[0], vocabulary[len(vocabulary) // 2], vocabulary[-1]
+            searches = [frequent, middle, rare, f'{words[0]} {words[1]}']
+
+            self.stdout.write(f'{"terms":<24} {"LIKE ms":>10} {"full-text ms":>14} {"matches":>10}')
+            for terms in searches:
+                like_ms = time_calls(lambda: list(
+                    Quote.objects.filter(is_active=True, text__icontains=terms)[:20]
+                ), options['repeat'])
+                search_ms = time_calls(lambda: search.search_quotes(terms), options['repeat'])
+                matches = search.matching(Quote.objects.all(), terms).count()
+                self.stdout.write(f'{terms:<24} {like_ms:>10.2f} {search_ms:>14.2f} {matches:>10}')
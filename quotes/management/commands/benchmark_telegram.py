@@ -0,0 +1,37 @@
+import time
+from django.core.management.base import BaseCommand
+from quotes.benchmarks import FakeBotAPIServer
+from quotes.telegram import TelegramSender
+
+
+class Command(BaseCommand):
+    help = 'Measure Telegram sender throughput against a local fake Bot API at several concurrency levels'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=500)
+        parser.add_argument('--concurrency', nargs='+', type=int, default=[1, 4, 16, 64])
+        parser.add_argument('--latency-ms', type=float, default=50,
+                            help='Simulated Bot API response time')
+        parser.add_argument('--rate-limit-every', type=int, default=0,
+                            help='Answer every Nth request with a 429')
+
+    def handle(self, *args, **options):
+        messages = [(100000 + i, f'Benchmark message {i}') for i in range(options['messages'])]
+
+        self.stdout.write(f'{"concurrency":>12} {"seconds":>10} {"messages/sec":>14} {"delivered":>10}')
+        for concurrency in options['concurrency']:
+            with FakeBotAPIServer(
+                latency=options['latency_ms'] / 1000,
+                rate_limit_every=options['rate_limit_every'],
+            ) as server:
+                # The global limit is lifted so the numbers show the sender itself
+                sender = TelegramSender(
+                    token='benchmark', api_url=server.url, concurrency=concurrency,
+                    global_rate=1_000_000,
+                )
+                started = time.perf_counter()
+                results = sender.send(messages)
+                elapsed = time.perf_counter() - started
+            self.stdout.write(
+                f'{concurrency:>12} {elapsed:>10.2f} {len(messages) / elapsed:>14.1f} {sum(results):>10}'
+            )
@@ -0,0 +1,39 @@
+import statistics
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from quotes.delivery import slot_load
+
+
+class Command(BaseCommand):
+    help = 'Report how evenly deliverable users are spread across delivery ticks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--minutes', type=int, default=settings.DELIVERY_TICK_MINUTES,
+                            help='Tick width to report on (defaults to DELIVERY_TICK_MINUTES)')
+        parser.add_argument('--top', type=int, default=10,
+                            help='Number of busiest ticks to list')
+
+    def handle(self, *args, **options):
+        minutes = options['minutes']
+        load = slot_load(minutes)
+        total = sum(load)
+        if not total:
+            self.stdout.write('No deliverable users')
+            return
+
+        busy = [users for users in load if users]
+        mean = total / len(load)
+        self.stdout.write(f'Tick width:         {minutes} min ({len(load)} ticks/day)')
+        self.stdout.write(f'Deliverable users:  {total}')
+        self.stdout.write(f'Ticks with load:    {len(busy)}')
+        self.stdout.write(f'Peak tick:          {max(load)} users')
+        self.stdout.write(f'Mean per tick:      {mean:.1f} users')
+        self.stdout.write(f'Mean per busy tick: {total / len(busy):.1f} users')
+        self.stdout.write(f'Std deviation:      {statistics.pstdev(load):.1f}')
+        self.stdout.write(f'Peak / busy mean:   {max(load) / (total / len(busy)):.2f}x')
+
+        self.stdout.write('Busiest ticks:')
+        busiest = sorted(range(len(load)), key=lambda tick: load[tick], reverse=True)[:options['top']]
+        for tick in busiest:
+            start = tick * minutes
+            self.stdout.write(f'  {start // 60:02d}:{start % 60:02d}  {load[tick]}')
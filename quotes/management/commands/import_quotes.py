@@ -0,0 +1,45 @@
+import io
+import os
+import sys
+from django.core.management.base import BaseCommand, CommandError
+from quotes.importer import FORMATS, QuoteImporter, read_rows
+
+
+class Command(BaseCommand):
+    help = 'Stream quotes from a CSV or JSONL file (or stdin) into the database in bulk'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='File to import, or - for stdin. Rows need text, author and category')
+        parser.add_argument('--format', choices=FORMATS,
+                            help='Input format; defaults to the file extension, or csv for stdin')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Rows written per transaction')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        format = options['format'] or (os.path.splitext(path)[1].lstrip('.').lower() if path != '-' else 'csv')
+        if format not in FORMATS:
+            raise CommandError(f'Cannot tell the format of {path}; pass --format {"/".join(FORMATS)}')
+
+        if path == '-':
+            stream = io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8', newline='')
+        else:
+            try:
+                stream = open(path, encoding='utf-8', newline='')
+            except OSError as e:
+                raise CommandError(f'Cannot open {path}: {e}')
+
+        importer = QuoteImporter(batch_size=options['batch_size'], progress=self.report)
+        with stream:
+            counts = importer.run(read_rows(stream, format, on_error=self.skip_line))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {counts['created']} quotes from {counts['read']} rows "
+            f"({counts['duplicates']} duplicates, {counts['invalid']} invalid)"
+        ))
+
+    def skip_line(self, number, message):
+        self.stderr.write(f'Skipping line {number}: {message}')
+
+    def report(self, counts, rate):
+        self.stdout.write(f"{counts['read']} rows read, {counts['created']} created ({rate:.0f} rows/sec)")
@@ -1,5 +1,6 @@
 from django.core.management.base import BaseCommand
 from django.utils.text import slugify
+from quotes.importer import QuoteImporter
 from quotes.models import Category, Quote
 
 
@@ -16,13 +17,11 @@ class Command(BaseCommand):
             {'name': 'Mindfulness', 'description': 'Quotes about being present and self-aware'},
         ]
 
-        categories = {}
         for cat_data in categories_data:
             category, created = Category.objects.get_or_create(
                 slug=slugify(cat_data['name']),
                 defaults={'name': cat_data['name'], 'description': cat_data['description']}
             )
-            categories[cat_data['name']] = category
             if created:
                 self.stdout.write(self.style.SUCCESS(f'Created category: {cat_data["name"]}'))
 
@@ -139,15 +138,10 @@ class Command(BaseCommand):
             ('Realize deeply that the present moment is all you have. Make the NOW the primary focus of your life.', 'Eckhart Tolle', 'Mindfulness'),
         ]
 
-        created_count = 0
-        for text, author, category_name in quotes_data:
-            quote, created = Quote.objects.get_or_create(
-                text=text,
-                author=author,
-                defaults={'category': categories[category_name]}
-            )
-            if created:
-                created_count += 1
+        counts = QuoteImporter().run(
+            {'text': text, 'author': author, 'category': category_name}
+            for text, author, category_name in quotes_data
+        )
 
-        self.stdout.write(self.style.SUCCESS(f'Successfully created {created_count} quotes!'))
+        self.stdout.write(self.style.SUCCESS(f'Successfully created {counts["created"]} quotes!'))
         self.stdout.write(self.style.SUCCESS(f'Total quotes in database: {Quote.objects.count()}'))
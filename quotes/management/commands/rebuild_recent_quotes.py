@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+from quotes.models import User, UserQuoteHistory
+
+
+class Command(BaseCommand):
+    help = 'Rebuild every user\'s recent-quote list from UserQuoteHistory'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Users rebuilt per query')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        user_ids = User.objects.order_by('id').values_list('id', flat=True)
+
+        rebuilt = 0
+        batch = []
+        for user_id in user_ids.iterator(chunk_size=batch_size):
+            batch.append(user_id)
+            if len(batch) == batch_size:
+                rebuilt += self.rebuild(batch)
+                batch = []
+        if batch:
+            rebuilt += self.rebuild(batch)
+
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt recent quotes for {rebuilt} users'))
+
+    def rebuild(self, user_ids):
+        recent = UserQuoteHistory.recent_quotes_for_users(user_ids)
+        users = [User(id=user_id, recent_quotes=quotes) for user_id, quotes in recent.items()]
+        User.objects.bulk_update(users, ['recent_quotes'])
+        return len(users)
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+from quotes import search
+
+
+class Command(BaseCommand):
+    help = 'Recreate the full-text quote search index and repopulate it from the quote table'
+
+    def handle(self, *args, **options):
+        # migrate repairs a missing index itself; this also repopulates one that drifted
+        with connection.schema_editor() as schema_editor:
+            search.install(schema_editor, rebuild=True)
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt the {connection.vendor} quote search index'))
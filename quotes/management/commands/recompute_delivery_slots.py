@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from quotes.delivery import recompute_delivery_slots, zones_changing_offset
+
+
+class Command(BaseCommand):
+    help = ('Recompute users\' UTC delivery slots, e.g. after changing DELIVERY_JITTER_MINUTES; '
+            'with --ahead, only for time zones changing UTC offset around now')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Users written per bulk update')
+        parser.add_argument('--ahead', type=int, metavar='HOURS',
+                            help='Only recompute zones with a DST transition within this many hours of now')
+
+    def handle(self, *args, **options):
+        zones = None
+        if options['ahead'] is not None:
+            zones = zones_changing_offset(timezone.now(), options['ahead'])
+            if not zones:
+                self.stdout.write('No time zones change offset in that window')
+                return
+            self.stdout.write(f'Time zones changing offset: {", ".join(zones)}')
+
+        updated = recompute_delivery_slots(zones, batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Updated delivery slots for {updated} users'))
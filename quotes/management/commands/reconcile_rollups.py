@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from quotes.rollups import reconcile
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the analytics rollups from UserQuoteHistory and ArchivedQuoteHistory'
+
+    def handle(self, *args, **options):
+        counts = reconcile()
+        self.stdout.write(self.style.SUCCESS(
+            f"Reconciled rollups for {counts['days']} days, {counts['categories']} categories "
+            f"and {counts['quotes']} quotes"
+        ))
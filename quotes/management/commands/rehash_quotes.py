@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from quotes.models import Quote
+from quotes.normalization import rehash_quotes
+
+
+class Command(BaseCommand):
+    help = 'Recompute every quote\'s content hash, e.g. after changing QUOTE_NORMALIZATION'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000,
+                            help='Quotes rehashed per transaction')
+
+    def handle(self, *args, **options):
+        hashed, duplicates = rehash_quotes(Quote, options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Rehashed {hashed} quotes ({duplicates} duplicates left unhashed)'))
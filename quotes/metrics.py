@@ -0,0 +1,136 @@
+"""
+Delivery pipeline metrics in the Prometheus text format.
+
+Workers record into an in-process buffer, which ``flush()`` adds to
+counters in the shared cache at the end of each task, so a chunk of
+thousands of deliveries costs a few dozen cache increments. The metrics
+view renders every known series from the cache. Durations are stored as
+integer microseconds because cache increments only take integers.
+"""
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+
+PREFIX = 'quotes:metrics:'
+
+STAGES = ('cohort_select', 'quote_pick', 'render', 'send', 'persist')
+OUTCOMES = ('sent', 'skipped_paused', 'skipped_already_sent', 'no_quote_available', 'no_channel', 'retrying', 'failed')
+CHANNELS = ('email', 'telegram')
+
+_lock = threading.Lock()
+_pending = Counter()
+
+
+def series_key(name, **labels):
+    return PREFIX + name + ''.join(f':{label}={value}' for label, value in sorted(labels.items()))
+
+
+def inc(name, amount=1, **labels):
+    if amount:
+        with _lock:
+            _pending[series_key(name, **labels)] += amount
+
+
+def count(outcome, amount=1):
+    """Add ``amount`` deliveries to the ``outcome`` counter"""
+    inc('deliveries', amount, outcome=outcome)
+
+
+def observe(channel, seconds, amount=1):
+    """Record ``amount`` sends on ``channel`` that each took ``seconds``"""
+    micros = round(seconds * 1_000_000)
+    for bucket in settings.METRICS_LATENCY_BUCKETS:
+        if seconds <= bucket:
+            inc('send_latency_bucket', amount, channel=channel, le=bucket)
+    inc('send_latency_sum', micros * amount, channel=channel)
+    inc('send_latency_count', amount, channel=channel)
+
+
+@contextmanager
+def timer(stage):
+    """Time the enclosed block as one run of pipeline ``stage``"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        inc('stage_seconds_sum', round((time.perf_counter() - started) * 1_000_000), stage=stage)
+        inc('stage_seconds_count', 1, stage=stage)
+
+
+def flush():
+    """Add the buffered values to the shared counters"""
+    with _lock:
+        pending = dict(_pending)
+        _pending.clear()
+    for key, amount in pending.items():
+        # add() creates the counter; incr() is atomic once it exists
+        if not cache.add(key, amount, timeout=None):
+            cache.incr(key, amount)
+
+
+def reset():
+    with _lock:
+        _pending.clear()
+    cache.delete_many(series_keys())
+
+
+def stage_seconds():
+    """``{stage: seconds}`` spent in each pipeline stage so far"""
+    values = cache.get_many([series_key('stage_seconds_sum', stage=stage) for stage in STAGES])
+    return {stage: values.get(series_key('stage_seconds_sum', stage=stage), 0) / 1_000_000 for stage in STAGES}
+
+
+def series_keys():
+    """Cache key of every series the exposition reports"""
+    keys = [series_key('deliveries', outcome=outcome) for outcome in OUTCOMES]
+    for stage in STAGES:
+        keys += [series_key('stage_seconds_sum', stage=stage), series_key('stage_seconds_count', stage=stage)]
+    for channel in CHANNELS:
+        keys += [series_key('send_latency_bucket', channel=channel, le=bucket) for bucket in settings.METRICS_LATENCY_BUCKETS]
+        keys += [series_key('send_latency_sum', channel=channel), series_key('send_latency_count', channel=channel)]
+    return keys
+
+
+def exposition():
+    """Every delivery metric in the Prometheus text exposition format"""
+    values = cache.get_many(series_keys())
+
+    def sample(metric, labels, value):
+        rendered = ','.join(f'{label}="{text}"' for label, text in labels.items())
+        return f'dailydose_{metric}{{{rendered}}} {value}'
+
+    lines = [
+        '# HELP dailydose_deliveries_total Due users by delivery outcome',
+        '# TYPE dailydose_deliveries_total counter',
+    ]
+    for outcome in OUTCOMES:
+        lines.append(sample('deliveries_total', {'outcome': outcome}, values.get(series_key('deliveries', outcome=outcome), 0)))
+
+    lines += [
+        '# HELP dailydose_delivery_stage_seconds Time spent in each delivery pipeline stage',
+        '# TYPE dailydose_delivery_stage_seconds summary',
+    ]
+    for stage in STAGES:
+        total = values.get(series_key('stage_seconds_sum', stage=stage), 0)
+        runs = values.get(series_key('stage_seconds_count', stage=stage), 0)
+        lines.append(sample('delivery_stage_seconds_sum', {'stage': stage}, total / 1_000_000))
+        lines.append(sample('delivery_stage_seconds_count', {'stage': stage}, runs))
+
+    lines += [
+        '# HELP dailydose_send_latency_seconds Time to send one quote, by channel',
+        '# TYPE dailydose_send_latency_seconds histogram',
+    ]
+    for channel in CHANNELS:
+        sends = values.get(series_key('send_latency_count', channel=channel), 0)
+        for bucket in settings.METRICS_LATENCY_BUCKETS:
+            hits = values.get(series_key('send_latency_bucket', channel=channel, le=bucket), 0)
+            lines.append(sample('send_latency_seconds_bucket', {'channel': channel, 'le': f'{bucket:g}'}, hits))
+        lines.append(sample('send_latency_seconds_bucket', {'channel': channel, 'le': '+Inf'}, sends))
+        total = values.get(series_key('send_latency_sum', channel=channel), 0)
+        lines.append(sample('send_latency_seconds_sum', {'channel': channel}, total / 1_000_000))
+        lines.append(sample('send_latency_seconds_count', {'channel': channel}, sends))
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,39 @@
+from django.conf import settings
+from . import profiling
+
+
+class QueryBudgetMiddleware:
+    """
+    Profile requests against the query budget (see quotes.profiling).
+
+    Runs for every request when QUERY_PROFILING is on, and for staff
+    requests sending the ``X-Query-Profile`` header, which also get the
+    numbers back in ``X-Query-*`` response headers. It sits near the top of
+    MIDDLEWARE so session and authentication queries count too; whether the
+    header came from staff is only known once the request has been handled.
+    Queries run while a streaming response is consumed are not counted.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        requested = profiling.PROFILE_HEADER in request.headers
+        if not (settings.QUERY_PROFILING or requested):
+            return self.get_response(request)
+
+        with profiling.profiled() as profile:
+            response = self.get_response(request)
+        requested = requested and getattr(request, 'user', None) is not None and request.user.is_staff
+        if not (settings.QUERY_PROFILING or requested):
+            return response
+        match = request.resolver_match
+        profile.name = match.view_name if match else 'unresolved'
+        profiling.report(profile, settings.QUERY_BUDGET_QUERIES, f'{request.method} {request.path} ({profile.name})')
+
+        if requested:
+            response['X-Query-Count'] = profile.queries
+            response['X-Query-Time-Ms'] = f'{profile.db_seconds * 1000:.1f}'
+            response['X-Query-Template-Ms'] = f'{profile.template_seconds * 1000:.1f}'
+            response['X-Query-Repeated'] = len(profile.repeated())
+        return response
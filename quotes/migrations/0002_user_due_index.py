@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-18 14:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quotes', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['is_active', 'preferred_time'], name='quotes_user_due_idx'),
+        ),
+    ]
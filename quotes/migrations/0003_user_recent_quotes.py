@@ -0,0 +1,48 @@
+# Generated by Django 4.2.7 on 2026-10-18 14:04
+
+from datetime import timedelta
+
+from django.db import migrations, models
+from django.utils import timezone
+
+BATCH_SIZE = 1000
+
+
+def backfill_recent_quotes(apps, schema_editor):
+    from quotes.models import REPEAT_WINDOW_DAYS
+
+    User = apps.get_model('quotes', 'User')
+    UserQuoteHistory = apps.get_model('quotes', 'UserQuoteHistory')
+    since = timezone.now() - timedelta(days=REPEAT_WINDOW_DAYS)
+    user_ids = list(
+        UserQuoteHistory.objects.filter(sent_at__gte=since).order_by('user_id')
+        .values_list('user_id', flat=True).distinct()
+    )
+    for start in range(0, len(user_ids), BATCH_SIZE):
+        recent = {user_id: [] for user_id in user_ids[start:start + BATCH_SIZE]}
+        rows = UserQuoteHistory.objects.filter(
+            user_id__in=recent, sent_at__gte=since
+        ).order_by('sent_at').values_list('user_id', 'quote_id', 'sent_at')
+        for user_id, quote_id, sent_at in rows:
+            recent[user_id].append([quote_id, sent_at.date().toordinal()])
+        User.objects.bulk_update(
+            [User(id=user_id, recent_quotes=quotes) for user_id, quotes in recent.items()], ['recent_quotes']
+        )
+
+
+class Migration(migrations.Migration):
+    # Each backfill batch commits on its own so large history tables are not read in one transaction
+    atomic = False
+
+    dependencies = [
+        ('quotes', '0002_user_due_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='recent_quotes',
+            field=models.JSONField(blank=True, default=list, editable=False, help_text='[quote_id, day ordinal] pairs for quotes sent in the repeat window'),
+        ),
+        migrations.RunPython(backfill_recent_quotes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 4.2.7 on 2026-10-18 14:05
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quotes', '0003_user_recent_quotes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedQuoteHistory',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sent_at', models.DateTimeField()),
+                ('is_favorite', models.BooleanField(default=False)),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name_plural': 'Archived Quote Histories',
+                'ordering': ['-sent_at'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='userquotehistory',
+            index=models.Index(fields=['user', '-sent_at', 'quote'], name='quotes_uqh_user_sent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userquotehistory',
+            index=models.Index(condition=models.Q(('is_favorite', True)), fields=['user', '-sent_at'], name='quotes_uqh_user_fav_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userquotehistory',
+            index=models.Index(fields=['-sent_at'], name='quotes_uqh_sent_idx'),
+        ),
+        migrations.AddField(
+            model_name='archivedquotehistory',
+            name='quote',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_user_history', to='quotes.quote'),
+        ),
+        migrations.AddField(
+            model_name='archivedquotehistory',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_quote_history', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='archivedquotehistory',
+            index=models.Index(fields=['user', '-sent_at'], name='quotes_aqh_user_sent_idx'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 4.2.7 on 2026-10-18 14:06
+
+from django.db import migrations, models
+
+
+def backfill_delivery_slots(apps, schema_editor):
+    User = apps.get_model('quotes', 'User')
+    preferred_times = User.objects.order_by().values_list('preferred_time', flat=True).distinct()
+    for preferred_time in list(preferred_times):
+        User.objects.filter(preferred_time=preferred_time).update(
+            delivery_slot=preferred_time.hour * 60 + preferred_time.minute
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quotes', '0004_history_indexes_and_archive'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='user',
+            name='quotes_user_due_idx',
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='delivery_slot',
+            field=models.PositiveSmallIntegerField(default=480, editable=False, help_text='Minute of the day (UTC) the daily quote is due, derived from preferred_time'),
+        ),
+        migrations.RunPython(backfill_delivery_slots, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['is_active', 'delivery_slot'], name='quotes_user_slot_idx'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.7 on 2026-10-18 14:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quotes', '0005_user_delivery_slot'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='telegram_chat_id',
+            field=models.BigIntegerField(blank=True, help_text='Telegram chat that receives quotes', null=True),
+        ),
+        migrations.AddField(
+            model_name='userpreference',
+            name='email_enabled',
+            field=models.BooleanField(default=True, help_text='Deliver quotes by email'),
+        ),
+        migrations.AddField(
+            model_name='userpreference',
+            name='telegram_enabled',
+            field=models.BooleanField(default=False, help_text='Deliver quotes on Telegram'),
+        ),
+    ]
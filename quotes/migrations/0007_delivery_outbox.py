@@ -0,0 +1,39 @@
+# Generated by Django 4.2.7 on 2026-10-18 14:20
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quotes', '0006_telegram_channel'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeliveryOutbox',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('delivery_date', models.DateField()),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('sent', 'Sent'), ('failed', 'Failed')], default='pending', max_length=10)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('last_error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('sent_at', models.DateTimeField(blank=True, null=True)),
+                ('quote', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='outbox', to='quotes.quote')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='outbox', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name_plural': 'Delivery Outbox',
+                'indexes': [models.Index(fields=['status', 'next_attempt_at'], name='quotes_outbox_due_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='deliveryoutbox',
+            constraint=models.UniqueConstraint(fields=('user', 'delivery_date'), name='quotes_outbox_idempotency_key'),
+        ),
+    ]
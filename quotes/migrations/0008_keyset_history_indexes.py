@@ -0,0 +1,37 @@
+# Generated by Django 4.2.7 on 2026-10-18 14:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quotes', '0007_delivery_outbox'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='archivedquotehistory',
+            name='quotes_aqh_user_sent_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='userquotehistory',
+            name='quotes_uqh_user_sent_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='userquotehistory',
+            name='quotes_uqh_user_fav_idx',
+        ),
+        migrations.AddIndex(
+            model_name='archivedquotehistory',
+            index=models.Index(fields=['user', '-sent_at', '-id'], name='quotes_aqh_user_sent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userquotehistory',
+            index=models.Index(fields=['user', '-sent_at', '-id', 'quote'], name='quotes_uqh_user_sent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userquotehistory',
+            index=models.Index(condition=models.Q(('is_favorite', True)), fields=['user', '-sent_at', '-id'], name='quotes_uqh_user_fav_idx'),
+        ),
+    ]
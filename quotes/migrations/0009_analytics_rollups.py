@@ -0,0 +1,50 @@
+# Generated by Django 4.2.7 on 2026-10-18 14:25
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quotes', '0008_keyset_history_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CategoryStats',
+            fields=[
+                ('category', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='quotes.category')),
+                ('deliveries', models.PositiveIntegerField(default=0)),
+                ('favorites', models.IntegerField(default=0)),
+            ],
+            options={
+                'verbose_name_plural': 'Category Stats',
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyStats',
+            fields=[
+                ('date', models.DateField(primary_key=True, serialize=False)),
+                ('deliveries', models.PositiveIntegerField(default=0)),
+                ('favorites', models.IntegerField(default=0)),
+                ('active_users', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name_plural': 'Daily Stats',
+                'ordering': ['-date'],
+            },
+        ),
+        migrations.CreateModel(
+            name='QuoteStats',
+            fields=[
+                ('quote', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='quotes.quote')),
+                ('deliveries', models.PositiveIntegerField(default=0)),
+                ('favorites', models.IntegerField(default=0)),
+            ],
+            options={
+                'verbose_name_plural': 'Quote Stats',
+                'indexes': [models.Index(fields=['-favorites'], name='quotes_qstats_fav_idx')],
+            },
+        ),
+    ]
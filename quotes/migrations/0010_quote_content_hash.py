@@ -0,0 +1,27 @@
+# Generated by Django 4.2.7 on 2026-10-18 14:30
+
+from django.db import migrations, models
+
+
+def backfill_content_hashes(apps, schema_editor):
+    from quotes.normalization import rehash_quotes
+
+    rehash_quotes(apps.get_model('quotes', 'Quote'))
+
+
+class Migration(migrations.Migration):
+    # Each backfill batch commits on its own so large quote tables are not hashed in one transaction
+    atomic = False
+
+    dependencies = [
+        ('quotes', '0009_analytics_rollups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='quote',
+            name='content_hash',
+            field=models.CharField(editable=False, max_length=64, null=True, unique=True),
+        ),
+        migrations.RunPython(backfill_content_hashes, migrations.RunPython.noop),
+    ]
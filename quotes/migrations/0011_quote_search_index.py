@@ -0,0 +1,24 @@
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    from quotes import search
+
+    search.install(schema_editor, rebuild=True)
+
+
+def drop_search_index(apps, schema_editor):
+    from quotes import search
+
+    search.uninstall(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quotes', '0010_quote_content_hash'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
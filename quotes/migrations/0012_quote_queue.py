@@ -0,0 +1,31 @@
+# Generated by Django 4.2.7 on 2026-10-18 14:50
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quotes', '0011_quote_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QueuedQuote',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('position', models.PositiveIntegerField()),
+                ('quote', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='queued', to='quotes.quote')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='quote_queue', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['user', 'position'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='queuedquote',
+            constraint=models.UniqueConstraint(fields=('user', 'position'), name='quotes_queue_position_key'),
+        ),
+    ]
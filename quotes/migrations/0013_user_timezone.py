@@ -0,0 +1,33 @@
+# Generated by Django 4.2.7 on 2026-10-18 15:00
+
+from django.db import migrations, models
+import quotes.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quotes', '0012_quote_queue'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='timezone',
+            field=models.CharField(default='UTC', help_text='IANA time zone of preferred_time, e.g. Europe/Berlin', max_length=64, validators=[quotes.models.validate_timezone]),
+        ),
+        migrations.AlterField(
+            model_name='user',
+            name='delivery_slot',
+            field=models.PositiveSmallIntegerField(default=480, editable=False, help_text='Minute of the day (UTC) the daily quote is due, derived from preferred_time and timezone'),
+        ),
+        migrations.AlterField(
+            model_name='user',
+            name='preferred_time',
+            field=models.TimeField(default='08:00:00', help_text="Time to receive daily quote, in the user's time zone"),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['timezone'], name='quotes_user_timezone_idx'),
+        ),
+    ]
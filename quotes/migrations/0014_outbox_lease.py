@@ -0,0 +1,23 @@
+# Generated by Django 4.2.7 on 2026-10-18 15:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quotes', '0013_user_timezone'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='deliveryoutbox',
+            name='leased_until',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='deliveryoutbox',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('sending', 'Sending'), ('sent', 'Sent'), ('unknown', 'Maybe sent'), ('failed', 'Failed')], default='pending', max_length=10),
+        ),
+    ]
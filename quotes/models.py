@@ -1,18 +1,107 @@
+import zlib
+from collections import defaultdict
+from functools import lru_cache
+from zoneinfo import ZoneInfo, available_timezones
+from django.conf import settings
+from django.core.exceptions import ValidationError
 from django.db import models
 from django.contrib.auth.models import AbstractUser
 from django.utils import timezone
-from datetime import timedelta
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+from . import catalog, normalization
+from .sampler import sampler
+
+# A quote is not sent to the same user again within this many days
+REPEAT_WINDOW_DAYS = 30
+
+
+@lru_cache(maxsize=1)
+def timezone_names():
+    return frozenset(available_timezones())
+
+
+def validate_timezone(value):
+    if value not in timezone_names():
+        raise ValidationError(f'{value!r} is not a known IANA time zone.')
+
+
+def delivery_slot_for(preferred_time, username='', timezone_name='UTC', now=None):
+    """
+    Minute of the day (0-1439, UTC) a user is due.
+
+    ``preferred_time`` is local to ``timezone_name`` and is converted with the
+    UTC offset in effect at its next occurrence after ``now``, so the slot
+    only moves around DST transitions (see recompute_delivery_slots).
+    Users sharing a preferred time are spread deterministically over the
+    following ``DELIVERY_JITTER_MINUTES`` minutes, keyed on their username.
+    """
+    if isinstance(preferred_time, str):
+        preferred_time = time.fromisoformat(preferred_time)
+    if timezone_name != 'UTC':
+        zone = ZoneInfo(timezone_name)
+        local_now = (now or timezone.now()).astimezone(zone)
+        local = datetime.combine(local_now.date(), preferred_time, tzinfo=zone)
+        if local <= local_now:
+            # Aware arithmetic keeps the wall time, so tomorrow's offset applies
+            local += timedelta(days=1)
+        preferred_time = local.astimezone(dt_timezone.utc).time()
+    slot = preferred_time.hour * 60 + preferred_time.minute
+    if settings.DELIVERY_JITTER_MINUTES > 1:
+        slot += zlib.crc32(username.encode()) % settings.DELIVERY_JITTER_MINUTES
+    return slot % 1440
 
 
 class User(AbstractUser):
     """Extended user model with additional fields for quote delivery"""
-    preferred_time = models.TimeField(default='08:00:00', help_text='Time to receive daily quote (UTC)')
+    preferred_time = models.TimeField(default='08:00:00', help_text='Time to receive daily quote, in the user\'s time zone')
+    timezone = models.CharField(
+        max_length=64, default='UTC', validators=[validate_timezone],
+        help_text='IANA time zone of preferred_time, e.g. Europe/Berlin'
+    )
     is_active = models.BooleanField(default=True)
     last_quote_sent = models.DateTimeField(null=True, blank=True)
+    telegram_chat_id = models.BigIntegerField(null=True, blank=True, help_text='Telegram chat that receives quotes')
+    delivery_slot = models.PositiveSmallIntegerField(
+        default=480, editable=False,
+        help_text='Minute of the day (UTC) the daily quote is due, derived from preferred_time and timezone'
+    )
+    recent_quotes = models.JSONField(
+        default=list, blank=True, editable=False,
+        help_text='[quote_id, day ordinal] pairs for quotes sent in the repeat window'
+    )
 
     class Meta:
         db_table = 'auth_user'
         swappable = 'AUTH_USER_MODEL'
+        indexes = [
+            models.Index(fields=['is_active', 'delivery_slot'], name='quotes_user_slot_idx'),
+            # Users whose slots move when their zone changes UTC offset
+            models.Index(fields=['timezone'], name='quotes_user_timezone_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        self.delivery_slot = delivery_slot_for(self.preferred_time, self.username, self.timezone)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'preferred_time', 'timezone'} & set(update_fields):
+            kwargs['update_fields'] = {*update_fields, 'delivery_slot'}
+        super().save(*args, **kwargs)
+
+    def get_recent_quote_ids(self, now=None):
+        """IDs of quotes sent to this user within the repeat window"""
+        cutoff = (now or timezone.now()).date().toordinal() - REPEAT_WINDOW_DAYS
+        return {quote_id for quote_id, day in self.recent_quotes if day > cutoff}
+
+    def remember_quote(self, quote_id, sent_at=None):
+        """Record a delivered quote, dropping entries that left the window. Does not save."""
+        day = (sent_at or timezone.now()).date().toordinal()
+        cutoff = day - REPEAT_WINDOW_DAYS
+        self.recent_quotes = [
+            [recent_id, recent_day] for recent_id, recent_day in self.recent_quotes if recent_day > cutoff
+        ] + [[quote_id, day]]
+
+    def rebuild_recent_quotes(self):
+        """Recompute ``recent_quotes`` from history. Does not save."""
+        self.recent_quotes = UserQuoteHistory.recent_quotes_for_users([self.id])[self.id]
 
 
 class Category(models.Model):
@@ -37,6 +126,8 @@ class Quote(models.Model):
     category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='quotes')
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    # SHA-256 of the normalized text (see quotes.normalization); NULL on duplicates that predate it
+    content_hash = models.CharField(max_length=64, unique=True, null=True, editable=False)
 
     class Meta:
         ordering = ['-created_at']
@@ -44,18 +135,60 @@ class Quote(models.Model):
     def __str__(self):
         return f"{self.text[:50]}... - {self.author}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remembered so save() can tell whether the text was edited
+        instance._loaded_text = instance.__dict__.get('text')
+        return instance
+
+    def save(self, *args, **kwargs):
+        # Duplicates that predate content_hash keep their NULL hash until their text is edited
+        if self._state.adding or self.content_hash is not None or self.text != getattr(self, '_loaded_text', None):
+            self.content_hash = normalization.content_hash(self.text)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'text' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'content_hash'}
+        super().save(*args, **kwargs)
+
 
 class UserPreference(models.Model):
     """User preferences for quote categories and delivery settings"""
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='preferences')
     preferred_categories = models.ManyToManyField(Category, blank=True)
     delivery_paused = models.BooleanField(default=False)
+    email_enabled = models.BooleanField(default=True, help_text='Deliver quotes by email')
+    telegram_enabled = models.BooleanField(default=False, help_text='Deliver quotes on Telegram')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return f"Preferences for {self.user.username}"
 
+    @classmethod
+    def categories_for_users(cls, user_ids):
+        """``{user_id: {category_id, ...}}`` of preferred categories for ``user_ids``, with one query"""
+        user_categories = defaultdict(set)
+        rows = cls.preferred_categories.through.objects.filter(
+            userpreference__user_id__in=user_ids
+        ).values_list('userpreference__user_id', 'category_id')
+        for user_id, category_id in rows:
+            user_categories[user_id].add(category_id)
+        return user_categories
+
+    @classmethod
+    def cohorts(cls, users):
+        """
+        Group ``users`` by the set of categories they prefer, as
+        ``{frozenset(category_ids): [user, ...]}``; users who chose none
+        share the empty set, meaning every category.
+        """
+        user_categories = cls.categories_for_users([user.id for user in users])
+        groups = defaultdict(list)
+        for user in users:
+            groups[frozenset(user_categories.get(user.id, ()))].append(user)
+        return groups
+
 
 class UserQuoteHistory(models.Model):
     """Track which quotes have been sent to which users"""
@@ -68,6 +201,19 @@ class UserQuoteHistory(models.Model):
         verbose_name_plural = 'User Quote Histories'
         ordering = ['-sent_at']
         unique_together = ['user', 'quote', 'sent_at']
+        indexes = [
+            # Per-user history pages (keyset on sent_at, id) and the recent-quote
+            # window; carries quote_id so the window can be read from the index alone
+            models.Index(fields=['user', '-sent_at', '-id', 'quote'], name='quotes_uqh_user_sent_idx'),
+            # Per-user favorites, newest first
+            models.Index(
+                fields=['user', '-sent_at', '-id'],
+                condition=models.Q(is_favorite=True),
+                name='quotes_uqh_user_fav_idx',
+            ),
+            # Global recent deliveries for analytics
+            models.Index(fields=['-sent_at'], name='quotes_uqh_sent_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} - {self.quote.text[:30]}... - {self.sent_at.date()}"
@@ -75,24 +221,181 @@ class UserQuoteHistory(models.Model):
     @classmethod
     def get_unsent_quote_for_user(cls, user):
         """Get a random quote that hasn't been sent to this user in the last 30 days"""
-        thirty_days_ago = timezone.now() - timedelta(days=30)
+        # Get user's preferred categories (an empty list means all categories)
+        category_ids = list(user.preferences.preferred_categories.values_list('id', flat=True))
+
+        # Exclude quotes sent in the last 30 days
+        quote_id = sampler.sample(category_ids, exclude=user.get_recent_quote_ids())
+        if quote_id is None:
+            return None
+        return catalog.quotes([quote_id]).get(quote_id)
 
-        # Get user's preferred categories
-        user_categories = user.preferences.preferred_categories.all()
+    @classmethod
+    def get_unsent_quotes_for_users(cls, users):
+        """
+        Pick a random unsent quote for each user in ``users``.
 
-        # If user has no preferences, use all categories
-        if not user_categories.exists():
-            quote_queryset = Quote.objects.filter(is_active=True)
-        else:
-            quote_queryset = Quote.objects.filter(is_active=True, category__in=user_categories)
+        Batch counterpart of ``get_unsent_quote_for_user``: runs a fixed number
+        of queries however many users are passed. Users preferring the same
+        categories share quotes wherever their history allows. Returns
+        ``{user_id: Quote}``; users with nothing left to receive are omitted.
+        """
+        now = timezone.now()
+        chosen = {}
+        for category_ids, members in UserPreference.cohorts(users).items():
+            excludes = [user.get_recent_quote_ids(now) for user in members]
+            picks = sampler.sample_cohort(category_ids, excludes, seed=now.date())
+            for user, quote_id in zip(members, picks):
+                if quote_id is not None:
+                    chosen[user.id] = quote_id
 
-        # Exclude quotes sent in the last 30 days
-        recent_quote_ids = cls.objects.filter(
-            user=user,
-            sent_at__gte=thirty_days_ago
-        ).values_list('quote_id', flat=True)
+        quotes = catalog.quotes(set(chosen.values()))
+        return {user_id: quotes[quote_id] for user_id, quote_id in chosen.items() if quote_id in quotes}
+
+    @classmethod
+    def recent_quotes_for_users(cls, user_ids):
+        """Build ``User.recent_quotes`` values for ``user_ids`` from history with one query"""
+        since = timezone.now() - timedelta(days=REPEAT_WINDOW_DAYS)
+        recent = {user_id: [] for user_id in user_ids}
+        rows = cls.objects.filter(
+            user_id__in=user_ids,
+            sent_at__gte=since
+        ).order_by('sent_at').values_list('user_id', 'quote_id', 'sent_at')
+        for user_id, quote_id, sent_at in rows:
+            recent[user_id].append([quote_id, sent_at.date().toordinal()])
+        return recent
+
+
+class DeliveryOutbox(models.Model):
+    """
+    A quote waiting to be delivered to a user.
+
+    Each user has at most one row per delivery date, so enqueueing the same
+    delivery twice is harmless. Dispatchers claim pending rows with
+    SELECT ... FOR UPDATE SKIP LOCKED and mark them ``sending`` until
+    ``leased_until``; the history row is written in the transaction that
+    marks the delivery sent. Rows whose lease ran out may or may not have
+    been delivered, so they are marked ``unknown`` instead of sent again.
+    """
+    PENDING = 'pending'
+    SENDING = 'sending'
+    SENT = 'sent'
+    UNKNOWN = 'unknown'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (SENDING, 'Sending'),
+        (SENT, 'Sent'),
+        (UNKNOWN, 'Maybe sent'),
+        (FAILED, 'Failed'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='outbox')
+    quote = models.ForeignKey(Quote, on_delete=models.CASCADE, related_name='outbox')
+    delivery_date = models.DateField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    leased_until = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name_plural = 'Delivery Outbox'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'delivery_date'], name='quotes_outbox_idempotency_key'),
+        ]
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='quotes_outbox_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.idempotency_key} ({self.status})"
+
+    @property
+    def idempotency_key(self):
+        return f"{self.user_id}:{self.delivery_date.isoformat()}"
+
+
+class QueuedQuote(models.Model):
+    """
+    A quote picked ahead of delivery for a user, filled off-peak by
+    quotes.queue. The lowest position is sent next.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='quote_queue')
+    quote = models.ForeignKey(Quote, on_delete=models.CASCADE, related_name='queued')
+    position = models.PositiveIntegerField()
+
+    class Meta:
+        ordering = ['user', 'position']
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'position'], name='quotes_queue_position_key'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id}: #{self.position} quote {self.quote_id}"
+
+
+class ArchivedQuoteHistory(models.Model):
+    """Cold storage for UserQuoteHistory rows older than the archive horizon"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='archived_quote_history')
+    quote = models.ForeignKey(Quote, on_delete=models.CASCADE, related_name='archived_user_history')
+    sent_at = models.DateTimeField()
+    is_favorite = models.BooleanField(default=False)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name_plural = 'Archived Quote Histories'
+        ordering = ['-sent_at']
+        indexes = [
+            models.Index(fields=['user', '-sent_at', '-id'], name='quotes_aqh_user_sent_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} - {self.quote.text[:30]}... - {self.sent_at.date()}"
 
-        quote_queryset = quote_queryset.exclude(id__in=recent_quote_ids)
 
-        # Return random quote
-        return quote_queryset.order_by('?').first()
+class DailyStats(models.Model):
+    """Deliveries, favorites and served users for one day, kept by quotes.rollups"""
+    date = models.DateField(primary_key=True)
+    deliveries = models.PositiveIntegerField(default=0)
+    # Favorites among the quotes delivered on this day
+    favorites = models.IntegerField(default=0)
+    active_users = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name_plural = 'Daily Stats'
+        ordering = ['-date']
+
+    def __str__(self):
+        return f"{self.date}: {self.deliveries} deliveries"
+
+
+class CategoryStats(models.Model):
+    """Running delivery and favorite totals for a category, kept by quotes.rollups"""
+    category = models.OneToOneField(Category, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+    deliveries = models.PositiveIntegerField(default=0)
+    favorites = models.IntegerField(default=0)
+
+    class Meta:
+        verbose_name_plural = 'Category Stats'
+
+    def __str__(self):
+        return f"{self.category_id}: {self.deliveries} deliveries"
+
+
+class QuoteStats(models.Model):
+    """Running delivery and favorite totals for a quote, kept by quotes.rollups"""
+    quote = models.OneToOneField(Quote, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+    deliveries = models.PositiveIntegerField(default=0)
+    favorites = models.IntegerField(default=0)
+
+    class Meta:
+        verbose_name_plural = 'Quote Stats'
+        indexes = [
+            models.Index(fields=['-favorites'], name='quotes_qstats_fav_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.quote_id}: {self.deliveries} deliveries"
@@ -0,0 +1,70 @@
+"""
+Normalized text hashing for quote deduplication.
+
+``Quote.content_hash`` holds the hash of a quote's text after the
+normalization steps named in QUOTE_NORMALIZATION, so two quotes that only
+differ in those respects collide on the unique index.
+"""
+import hashlib
+import re
+
+from django.conf import settings
+from django.db import transaction
+
+WHITESPACE = re.compile(r'\s+')
+QUOTE_MARKS = str.maketrans({'“': '"', '”': '"', '„': '"', '‘': "'", '’': "'", '‚': "'"})
+
+STEPS = {
+    # Collapse runs of whitespace and trim the ends
+    'whitespace': lambda text: WHITESPACE.sub(' ', text).strip(),
+    # Straighten typographic quote marks and drop the ones wrapping the whole text
+    'quotes': lambda text: text.translate(QUOTE_MARKS).strip().strip('"\'').strip(),
+    'case': str.casefold,
+}
+
+
+def normalize_text(text, steps=None):
+    """Apply the QUOTE_NORMALIZATION steps (or ``steps``) to ``text`` in order"""
+    for step in settings.QUOTE_NORMALIZATION if steps is None else steps:
+        text = STEPS[step](text)
+    return text
+
+
+def content_hash(text):
+    return hashlib.sha256(normalize_text(text).encode()).hexdigest()
+
+
+def rehash_quotes(quote_model, batch_size=2000):
+    """
+    Recompute ``content_hash`` for every quote, one transaction per batch of
+    ``batch_size``. The first quote with a given text keeps the hash; later
+    duplicates are left without one. Returns ``(hashed, duplicates)``.
+    """
+    hashed = duplicates = 0
+    last_id = 0
+    while True:
+        with transaction.atomic():
+            batch = list(
+                quote_model.objects.filter(id__gt=last_id).order_by('id').only('id', 'text')[:batch_size]
+            )
+            if not batch:
+                return hashed, duplicates
+            last_id = batch[-1].id
+
+            digests = {quote.id: content_hash(quote.text) for quote in batch}
+            taken = dict(
+                quote_model.objects.filter(content_hash__in=set(digests.values()))
+                .exclude(id__in=digests).values_list('content_hash', 'id')
+            )
+            # Hashes are moved in two steps so swapping them within a batch never collides
+            quote_model.objects.filter(id__in=digests).update(content_hash=None)
+            for quote in batch:
+                digest = digests[quote.id]
+                if digest in taken:
+                    quote.content_hash = None
+                    duplicates += 1
+                else:
+                    quote.content_hash = digest
+                    taken[digest] = quote.id
+                    hashed += 1
+            quote_model.objects.bulk_update(batch, ['content_hash'])
@@ -0,0 +1,55 @@
+"""
+Keyset pagination for quote history.
+
+Pages are ordered newest first on ``(sent_at, id)`` and the cursor is the
+position of the last row served, so fetching page N costs the same index
+range scan as page 1 instead of an ever-growing OFFSET.
+"""
+import heapq
+from datetime import datetime, timedelta, timezone
+
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def encode_cursor(history):
+    """Opaque cursor pointing just past ``history``"""
+    micros = (history.sent_at - EPOCH) // timedelta(microseconds=1)
+    return f'{micros}-{history.id}'
+
+
+def decode_cursor(cursor):
+    """``(sent_at, id)`` for a cursor from encode_cursor, or None if it is malformed"""
+    try:
+        micros, history_id = (int(part) for part in cursor.split('-'))
+        sent_at = EPOCH + timedelta(microseconds=micros)
+    except (AttributeError, ValueError, OverflowError):
+        return None
+    return sent_at, history_id
+
+
+def keyset_page(querysets, cursor=None, size=20):
+    """
+    Return ``(rows, next_cursor)`` with the ``size`` rows that come after
+    ``cursor``, newest first, from one queryset or a list of them (such as
+    live and archived history, merged on sent_at). ``next_cursor`` is None
+    on the last page.
+    """
+    if not isinstance(querysets, (list, tuple)):
+        querysets = [querysets]
+    position = decode_cursor(cursor) if cursor else None
+    pages = []
+    for queryset in querysets:
+        queryset = queryset.order_by('-sent_at', '-id')
+        if position:
+            sent_at, history_id = position
+            # (sent_at, id) < cursor, phrased so sent_at bounds the index range scan
+            queryset = queryset.filter(sent_at__lte=sent_at).exclude(sent_at=sent_at, id__gte=history_id)
+        pages.append(list(queryset[:size + 1]))
+
+    # A user's live and archived rows never share a sent_at, so ids only break ties within one table
+    rows = list(heapq.merge(*pages, key=lambda row: (row.sent_at, row.id), reverse=True))[:size + 1]
+    if len(rows) > size:
+        rows = rows[:size]
+        return rows, encode_cursor(rows[-1])
+    return rows, None
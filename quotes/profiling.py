@@ -0,0 +1,183 @@
+"""
+Per-request and per-task query budgets.
+
+A profile counts the queries run on every database connection, their total
+time, statements repeated often enough to suggest an N+1 pattern, and time
+spent rendering templates. Profiles that go over budget are logged, and
+every profile is added to per-view (or per-task) totals in the shared cache
+for the staff summary page.
+
+Requests are profiled by QueryBudgetMiddleware, Celery tasks through the
+task_prerun and task_postrun signals below; both only when QUERY_PROFILING
+is on, or for a staff request carrying the PROFILE_HEADER header.
+"""
+import logging
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+
+from celery.signals import task_postrun, task_prerun
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+PREFIX = 'quotes:profile:'
+NAMES_KEY = PREFIX + 'names'
+FIELDS = ('runs', 'queries', 'db_us', 'template_us', 'total_us', 'over_budget', 'repeated')
+
+PROFILE_HEADER = 'X-Query-Profile'
+
+_current = ContextVar('query_profile', default=None)
+
+
+class QueryProfile:
+    """Query and template timings for one request or task, filled in while it runs"""
+
+    def __init__(self, name=''):
+        self.name = name
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.template_seconds = 0.0
+        self.total_seconds = 0.0
+        self.statements = Counter()
+        self._rendering = False
+
+    def __call__(self, execute, sql, params, many, context):
+        """Execute wrapper timing each query; ``sql`` still has its placeholders, so repeats share a key"""
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_seconds += time.perf_counter() - started
+            self.queries += 1
+            self.statements[sql] += 1
+
+    def repeated(self):
+        """``(sql, times)`` for statements run at least QUERY_PROFILING_REPEATS times, most repeated first"""
+        return [
+            (sql, times) for sql, times in self.statements.most_common()
+            if times >= settings.QUERY_PROFILING_REPEATS
+        ]
+
+
+@contextmanager
+def profiled(name=''):
+    """Profile the block, yielding its QueryProfile"""
+    profile = QueryProfile(name)
+    token = _current.set(profile)
+    started = time.perf_counter()
+    try:
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(profile))
+            yield profile
+    finally:
+        profile.total_seconds = time.perf_counter() - started
+        _current.reset(token)
+
+
+def install_template_timer():
+    """Wrap Django template rendering so the active profile is charged for it"""
+    from django.template.backends.django import Template
+
+    render = Template.render
+
+    def timed_render(self, context=None, request=None):
+        profile = _current.get()
+        # Templates rendered from inside another render are already being timed
+        if profile is None or profile._rendering:
+            return render(self, context, request)
+        profile._rendering = True
+        started = time.perf_counter()
+        try:
+            return render(self, context, request)
+        finally:
+            profile.template_seconds += time.perf_counter() - started
+            profile._rendering = False
+
+    Template.render = timed_render
+
+
+def report(profile, query_budget, label=None):
+    """
+    Log ``profile`` if it went over ``query_budget`` queries or
+    QUERY_BUDGET_DB_MS of database time, and add it to the summary.
+    """
+    repeated = profile.repeated()
+    over_budget = profile.queries > query_budget or profile.db_seconds * 1000 > settings.QUERY_BUDGET_DB_MS
+    if over_budget:
+        logger.warning(
+            '%s ran %d queries in %.1f ms (budget %d queries, %d ms); templates %.1f ms, total %.1f ms%s',
+            label or profile.name, profile.queries, profile.db_seconds * 1000, query_budget,
+            settings.QUERY_BUDGET_DB_MS, profile.template_seconds * 1000, profile.total_seconds * 1000,
+            ''.join(f'\n  repeated {times}x: {sql}' for sql, times in repeated[:5]),
+        )
+    record(profile.name, {
+        'runs': 1,
+        'queries': profile.queries,
+        'db_us': round(profile.db_seconds * 1_000_000),
+        'template_us': round(profile.template_seconds * 1_000_000),
+        'total_us': round(profile.total_seconds * 1_000_000),
+        'over_budget': int(over_budget),
+        'repeated': int(bool(repeated)),
+    })
+
+
+def key(name, field):
+    return f'{PREFIX}{name}:{field}'
+
+
+def record(name, values):
+    names = cache.get(NAMES_KEY, set())
+    if name not in names:
+        cache.set(NAMES_KEY, names | {name}, timeout=None)
+    for field, amount in values.items():
+        if amount and not cache.add(key(name, field), amount, timeout=None):
+            cache.incr(key(name, field), amount)
+
+
+def summary():
+    """Averages per profiled view or task, the most database time first"""
+    names = sorted(cache.get(NAMES_KEY, set()))
+    values = cache.get_many([key(name, field) for name in names for field in FIELDS])
+    rows = []
+    for name in names:
+        totals = {field: values.get(key(name, field), 0) for field in FIELDS}
+        runs = totals['runs'] or 1
+        rows.append({
+            'name': name,
+            'runs': totals['runs'],
+            'queries': totals['queries'] / runs,
+            'db_ms': totals['db_us'] / runs / 1000,
+            'template_ms': totals['template_us'] / runs / 1000,
+            'total_ms': totals['total_us'] / runs / 1000,
+            'over_budget': totals['over_budget'],
+            'repeated': totals['repeated'],
+        })
+    return sorted(rows, key=lambda row: row['db_ms'] * row['runs'], reverse=True)
+
+
+def reset():
+    names = cache.get(NAMES_KEY, set())
+    cache.delete_many([NAMES_KEY, *(key(name, field) for name in names for field in FIELDS)])
+
+
+_tasks = {}
+
+
+@task_prerun.connect
+def start_task_profile(task_id, task, **kwargs):
+    if settings.QUERY_PROFILING:
+        stack = ExitStack()
+        _tasks[task_id] = (stack, stack.enter_context(profiled(f'task:{task.name}')))
+
+
+@task_postrun.connect
+def finish_task_profile(task_id, **kwargs):
+    if task_id in _tasks:
+        stack, profile = _tasks.pop(task_id)
+        stack.close()
+        report(profile, settings.QUERY_BUDGET_TASK_QUERIES)
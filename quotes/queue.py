@@ -0,0 +1,119 @@
+"""
+Precomputed next-quote queues.
+
+The off-peak refill job picks each user's next QUOTE_QUEUE_SIZE quotes
+ahead of time, from their preferred categories and outside their repeat
+window, so the delivery tick only has to pop the head of the queue. Users
+preferring the same categories are filled as a cohort, so they tend to be
+sent the same quote on the same day. Queued quotes are checked again when
+popped; users whose queue is empty or stale fall back to picking at send
+time.
+"""
+from django.conf import settings
+from django.db.models import Max
+from django.utils import timezone
+from . import catalog
+from .models import QueuedQuote, User, UserPreference, UserQuoteHistory
+from .sampler import sampler
+
+
+def fill_queues(users, size=None):
+    """
+    Top up the queue of each of ``users`` to ``size`` quotes (default
+    QUOTE_QUEUE_SIZE). Returns the number of quotes queued.
+    """
+    size = size or settings.QUOTE_QUEUE_SIZE
+    user_ids = [user.id for user in users]
+    queued = {user_id: [] for user_id in user_ids}
+    for user_id, quote_id in QueuedQuote.objects.filter(user_id__in=user_ids).values_list('user_id', 'quote_id'):
+        queued[user_id].append(quote_id)
+    next_positions = dict(
+        QueuedQuote.objects.filter(user_id__in=user_ids).values('user_id')
+        .annotate(last=Max('position')).values_list('user_id', 'last')
+    )
+
+    now = timezone.now()
+    rows = []
+    for category_ids, members in UserPreference.cohorts(users).items():
+        excludes = {user.id: user.get_recent_quote_ids(now) | set(queued[user.id]) for user in members}
+        positions = {user.id: next_positions.get(user.id, 0) for user in members}
+        short = [user for user in members if len(queued[user.id]) < size]
+        # Each round queues one more quote per user, shared across the cohort where history allows
+        rounds = 0
+        while short:
+            rounds += 1
+            picks = sampler.sample_cohort(category_ids, [excludes[user.id] for user in short], seed=f'{now.date()}:{rounds}')
+            still_short = []
+            for user, quote_id in zip(short, picks):
+                if quote_id is None:
+                    continue
+                excludes[user.id].add(quote_id)
+                queued[user.id].append(quote_id)
+                positions[user.id] += 1
+                rows.append(QueuedQuote(user_id=user.id, quote_id=quote_id, position=positions[user.id]))
+                if len(queued[user.id]) < size:
+                    still_short.append(user)
+            short = still_short
+    QueuedQuote.objects.bulk_create(rows)
+    return len(rows)
+
+
+def refill_queues(batch_size=1000):
+    """Top up the queue of every active user, ``batch_size`` users at a time"""
+    queued = 0
+    last_id = 0
+    while True:
+        users = list(
+            User.objects.filter(is_active=True, id__gt=last_id).order_by('id')
+            .only('id', 'recent_quotes')[:batch_size]
+        )
+        if not users:
+            return queued
+        last_id = users[-1].id
+        queued += fill_queues(users)
+
+
+def pop_quotes(users):
+    """
+    Take today's quote for each of ``users`` off the head of their queue.
+
+    A queued quote is skipped when it has been deactivated or falls inside
+    the user's repeat window; it and the quotes before it are removed.
+    Users left without one get a quote picked now. Returns
+    ``{user_id: Quote}``, omitting users with nothing left to receive.
+    """
+    heads = {}
+    for row_id, user_id, quote_id in QueuedQuote.objects.filter(
+        user_id__in=[user.id for user in users]
+    ).order_by('user_id', 'position').values_list('id', 'user_id', 'quote_id'):
+        heads.setdefault(user_id, []).append((row_id, quote_id))
+    quotes = catalog.quotes({quote_id for rows in heads.values() for _, quote_id in rows})
+
+    now = timezone.now()
+    chosen = {}
+    consumed = []
+    for user in users:
+        recent = user.get_recent_quote_ids(now)
+        for row_id, quote_id in heads.get(user.id, []):
+            consumed.append(row_id)
+            if quote_id in quotes and quote_id not in recent:
+                chosen[user.id] = quotes[quote_id]
+                break
+    if consumed:
+        QueuedQuote.objects.filter(id__in=consumed).delete()
+
+    missing = [user for user in users if user.id not in chosen]
+    if missing:
+        chosen.update(UserQuoteHistory.get_unsent_quotes_for_users(missing))
+    return chosen
+
+
+def rebuild_queue(user):
+    """Replace ``user``'s queue, e.g. after their preferred categories changed"""
+    QueuedQuote.objects.filter(user=user).delete()
+    fill_queues([user])
+
+
+def drop_quotes(quote_ids):
+    """Remove ``quote_ids`` from every queue, e.g. after they were deactivated"""
+    QueuedQuote.objects.filter(quote_id__in=quote_ids).delete()
@@ -0,0 +1,154 @@
+"""
+Precomputed analytics counters.
+
+Deliveries and favorite toggles add to per-day, per-category and per-quote
+counters as they happen, so the analytics page reads a handful of small
+rows instead of counting the history table. ``reconcile`` rebuilds every
+counter from the history tables to correct any drift.
+"""
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Case, Count, F, Q, Sum, Value, When
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from .models import (
+    ArchivedQuoteHistory, Category, CategoryStats, DailyStats, Quote, QuoteStats, User, UserQuoteHistory,
+)
+
+TOTALS_CACHE_KEY = 'quotes:analytics:totals'
+
+
+def increment(model, key_field, increments):
+    """
+    Add ``increments`` (``{field: {key: amount}}``) to the counters of
+    ``model`` rows keyed by ``key_field``, creating missing rows. Costs two
+    queries however many keys are touched.
+    """
+    keys = {key for amounts in increments.values() for key in amounts}
+    if not keys:
+        return
+    model.objects.bulk_create([model(**{key_field: key}) for key in keys], ignore_conflicts=True)
+    model.objects.filter(**{f'{key_field}__in': keys}).update(**{
+        field: F(field) + Case(
+            *(When(**{key_field: key}, then=Value(amount)) for key, amount in amounts.items()),
+            default=Value(0),
+        )
+        for field, amounts in increments.items()
+    })
+
+
+def record_deliveries(history):
+    """Count freshly written UserQuoteHistory rows (with ``quote`` loaded)"""
+    if not history:
+        return
+    days = Counter(timezone.localdate(record.sent_at) for record in history)
+    users = Counter()
+    for day, user_id in {(timezone.localdate(record.sent_at), record.user_id) for record in history}:
+        users[day] += 1
+    increment(DailyStats, 'date', {'deliveries': days, 'active_users': users})
+    increment(CategoryStats, 'category_id', {
+        'deliveries': Counter(record.quote.category_id for record in history),
+    })
+    increment(QuoteStats, 'quote_id', {
+        'deliveries': Counter(record.quote_id for record in history),
+    })
+
+
+def record_favorite(history):
+    """Count a toggle of ``history.is_favorite`` (with ``quote`` loaded)"""
+    delta = 1 if history.is_favorite else -1
+    increment(DailyStats, 'date', {'favorites': {timezone.localdate(history.sent_at): delta}})
+    increment(CategoryStats, 'category_id', {'favorites': {history.quote.category_id: delta}})
+    increment(QuoteStats, 'quote_id', {'favorites': {history.quote_id: delta}})
+
+
+def headline_totals():
+    """User, quote, category and delivery totals, cached for ANALYTICS_TOTALS_TIMEOUT"""
+    totals = cache.get(TOTALS_CACHE_KEY)
+    if totals is None:
+        totals = refresh_headline_totals()
+    return totals
+
+
+def refresh_headline_totals():
+    users = User.objects.aggregate(total=Count('id'), active=Count('id', filter=Q(is_active=True)))
+    totals = {
+        'total_users': users['total'],
+        'active_users': users['active'],
+        'total_quotes': Quote.objects.filter(is_active=True).count(),
+        'total_categories': Category.objects.count(),
+        'total_sent': DailyStats.objects.aggregate(total=Sum('deliveries'))['total'] or 0,
+    }
+    cache.set(TOTALS_CACHE_KEY, totals, settings.ANALYTICS_TOTALS_TIMEOUT)
+    return totals
+
+
+def history_counts(group_by):
+    """
+    ``{key: (deliveries, favorites, users)}`` over live and archived history,
+    grouped by the ``group_by`` expression.
+    """
+    counts = {}
+    for model in (UserQuoteHistory, ArchivedQuoteHistory):
+        rows = model.objects.order_by().annotate(key=group_by).values('key').annotate(
+            deliveries=Count('id'),
+            favorites=Count('id', filter=Q(is_favorite=True)),
+            users=Count('user', distinct=True),
+        )
+        for row in rows.iterator():
+            deliveries, favorites, users = counts.get(row['key'], (0, 0, 0))
+            # A user never receives a quote twice in a day, so live and
+            # archived rows for one day never share a user
+            counts[row['key']] = (
+                deliveries + row['deliveries'], favorites + row['favorites'], users + row['users'],
+            )
+    return counts
+
+
+def lock_counters():
+    """
+    Hold off counter writes until the current transaction ends, so history
+    written and counted concurrently is counted exactly once. SQLite
+    transactions already take the write lock up front (BEGIN IMMEDIATE).
+    """
+    if connection.vendor == 'postgresql':
+        tables = ', '.join(
+            connection.ops.quote_name(model._meta.db_table) for model in (DailyStats, CategoryStats, QuoteStats)
+        )
+        with connection.cursor() as cursor:
+            # Conflicts with INSERT/UPDATE/DELETE but not with reads of the counters
+            cursor.execute(f'LOCK TABLE {tables} IN SHARE ROW EXCLUSIVE MODE')
+
+
+def reconcile():
+    """
+    Rebuild every rollup from the history tables and refresh the cached
+    totals. Deliveries and favorite toggles wait while the history is counted.
+    """
+    with transaction.atomic():
+        lock_counters()
+        daily = history_counts(TruncDate('sent_at'))
+        categories = history_counts(F('quote__category_id'))
+        quotes = history_counts(F('quote_id'))
+
+        DailyStats.objects.all().delete()
+        DailyStats.objects.bulk_create(
+            DailyStats(date=day, deliveries=deliveries, favorites=favorites, active_users=users)
+            for day, (deliveries, favorites, users) in daily.items()
+        )
+        CategoryStats.objects.all().delete()
+        CategoryStats.objects.bulk_create(
+            CategoryStats(category_id=category_id, deliveries=deliveries, favorites=favorites)
+            for category_id, (deliveries, favorites, users) in categories.items()
+        )
+        QuoteStats.objects.all().delete()
+        QuoteStats.objects.bulk_create(
+            (QuoteStats(quote_id=quote_id, deliveries=deliveries, favorites=favorites)
+             for quote_id, (deliveries, favorites, users) in quotes.items()),
+            batch_size=1000,
+        )
+    refresh_headline_totals()
+    return {'days': len(daily), 'categories': len(categories), 'quotes': len(quotes)}
@@ -0,0 +1,116 @@
+"""
+Random quote selection without ORDER BY RANDOM().
+
+Active quote IDs are held in memory as one dense array per category. A draw
+picks a uniform index across the arrays for the user's categories and
+rejects IDs the user has received recently, so selection never sorts the
+quote table. Users with the same preferred categories are served as one
+cohort that shares its draws, so a delivery tick needs few distinct quotes.
+"""
+import bisect
+import random
+import threading
+import time
+
+from django.conf import settings
+from . import catalog
+
+
+class QuoteSampler:
+    """Per-category dense arrays of active quote IDs with rejection sampling"""
+
+    # Random probes before falling back to scanning what is left of the pool
+    max_probes = 16
+    # Shared draws offered to a cohort before its remaining users are sampled individually
+    max_cohort_draws = 8
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pools = None
+        self._loaded_at = 0.0
+
+    def load(self):
+        """Fetch the per-category arrays from the quote catalog"""
+        return catalog.quote_ids_by_category()
+
+    def pools(self):
+        with self._lock:
+            expired = time.monotonic() - self._loaded_at > settings.QUOTE_SAMPLER_TTL
+            if self._pools is None or expired:
+                self._pools = self.load()
+                self._loaded_at = time.monotonic()
+            return self._pools
+
+    def invalidate(self):
+        with self._lock:
+            self._pools = None
+
+    def sample(self, category_ids=None, exclude=(), rng=random):
+        """
+        Return a uniformly random active quote ID from ``category_ids`` (all
+        categories when empty) that is not in ``exclude``, or None when every
+        candidate has been excluded. Draws come from ``rng``.
+        """
+        pools = self.pools()
+        if category_ids:
+            arrays = [pools[category_id] for category_id in category_ids if pools.get(category_id)]
+        else:
+            arrays = [array for array in pools.values() if array]
+        if not arrays:
+            return None
+
+        # offsets[i] is the index just past arrays[i] in the concatenated pool
+        offsets = []
+        total = 0
+        for array in arrays:
+            total += len(array)
+            offsets.append(total)
+
+        for _ in range(self.max_probes):
+            index = rng.randrange(total)
+            position = bisect.bisect_right(offsets, index)
+            start = offsets[position - 1] if position else 0
+            quote_id = arrays[position][index - start]
+            if quote_id not in exclude:
+                return quote_id
+
+        # Most of the pool is excluded; draw from whatever is left
+        remaining = [quote_id for array in arrays for quote_id in array if quote_id not in exclude]
+        return rng.choice(remaining) if remaining else None
+
+    def sample_cohort(self, category_ids, excludes, seed=''):
+        """
+        Pick quotes for a cohort of users sharing ``category_ids``, one per
+        set in ``excludes``, using as few distinct quotes as possible.
+
+        Each draw goes to every user still waiting who has not had it
+        recently; after ``max_cohort_draws`` draws the stragglers are sampled
+        one by one. The shared draws are seeded from ``seed`` and the
+        categories, so every chunk of the cohort, in any worker, draws the
+        same quotes. Returns the quote IDs (None where nothing is left) in
+        the order of ``excludes``.
+        """
+        rng = random.Random(f'{seed}:{sorted(category_ids or ())}')
+        picks = [None] * len(excludes)
+        waiting = range(len(excludes))
+        drawn = set()
+        for _ in range(self.max_cohort_draws):
+            if not waiting:
+                return picks
+            quote_id = self.sample(category_ids, exclude=drawn, rng=rng)
+            if quote_id is None:
+                return picks
+            drawn.add(quote_id)
+            still_waiting = []
+            for index in waiting:
+                if quote_id in excludes[index]:
+                    still_waiting.append(index)
+                else:
+                    picks[index] = quote_id
+            waiting = still_waiting
+        for index in waiting:
+            picks[index] = self.sample(category_ids, exclude=excludes[index])
+        return picks
+
+
+sampler = QuoteSampler()
@@ -0,0 +1,173 @@
+"""
+Full-text quote search.
+
+SQLite keeps an FTS5 index in ``quotes_quote_fts`` and PostgreSQL a
+generated ``search_vector`` column with a GIN index. Both are maintained by
+the database itself on every insert, update and delete of a quote, bulk
+writes included, so the index never needs a separate refresh job. Other
+databases fall back to substring matching.
+"""
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.db.models.expressions import RawSQL
+from . import catalog
+from .models import Quote
+
+SQLITE_INDEX = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS quotes_quote_fts USING fts5(
+        text, author, content='quotes_quote', content_rowid='id', tokenize='porter unicode61'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS quotes_quote_fts_insert AFTER INSERT ON quotes_quote BEGIN
+        INSERT INTO quotes_quote_fts(rowid, text, author) VALUES (new.id, new.text, new.author);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS quotes_quote_fts_delete AFTER DELETE ON quotes_quote BEGIN
+        INSERT INTO quotes_quote_fts(quotes_quote_fts, rowid, text, author)
+        VALUES ('delete', old.id, old.text, old.author);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS quotes_quote_fts_update AFTER UPDATE OF text, author ON quotes_quote BEGIN
+        INSERT INTO quotes_quote_fts(quotes_quote_fts, rowid, text, author)
+        VALUES ('delete', old.id, old.text, old.author);
+        INSERT INTO quotes_quote_fts(rowid, text, author) VALUES (new.id, new.text, new.author);
+    END""",
+]
+
+SQLITE_DROP = [
+    'DROP TRIGGER IF EXISTS quotes_quote_fts_insert',
+    'DROP TRIGGER IF EXISTS quotes_quote_fts_delete',
+    'DROP TRIGGER IF EXISTS quotes_quote_fts_update',
+    'DROP TABLE IF EXISTS quotes_quote_fts',
+]
+
+POSTGRES_VECTOR = (
+    "setweight(to_tsvector('english', coalesce(text, '')), 'A') || "
+    "setweight(to_tsvector('english', coalesce(author, '')), 'B')"
+)
+
+POSTGRES_INDEX = [
+    f'ALTER TABLE quotes_quote ADD COLUMN IF NOT EXISTS search_vector tsvector '
+    f'GENERATED ALWAYS AS ({POSTGRES_VECTOR}) STORED',
+    'CREATE INDEX IF NOT EXISTS quotes_quote_search_idx ON quotes_quote USING GIN (search_vector)',
+]
+
+POSTGRES_DROP = [
+    'DROP INDEX IF EXISTS quotes_quote_search_idx',
+    'ALTER TABLE quotes_quote DROP COLUMN IF EXISTS search_vector',
+]
+
+WORD = re.compile(r'\w+')
+
+
+def install(schema_editor, rebuild=False):
+    """
+    Create the search index for the current database if it is missing, and
+    with ``rebuild`` repopulate it from the quote table.
+    """
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        for sql in SQLITE_INDEX:
+            schema_editor.execute(sql)
+        if rebuild:
+            schema_editor.execute("INSERT INTO quotes_quote_fts(quotes_quote_fts) VALUES ('rebuild')")
+    elif vendor == 'postgresql':
+        # The generated column is recomputed by PostgreSQL, so there is nothing to rebuild
+        for sql in POSTGRES_INDEX:
+            schema_editor.execute(sql)
+
+
+def is_installed(connection):
+    """Whether every part of the search index exists on ``connection``"""
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute("SELECT name FROM sqlite_master WHERE name LIKE 'quotes_quote_fts%%'")
+            names = {row[0] for row in cursor.fetchall()}
+            return {
+                'quotes_quote_fts', 'quotes_quote_fts_insert', 'quotes_quote_fts_delete', 'quotes_quote_fts_update',
+            } <= names
+        if connection.vendor == 'postgresql':
+            columns = connection.introspection.get_table_description(cursor, 'quotes_quote')
+            return any(column.name == 'search_vector' for column in columns)
+    return True
+
+
+def uninstall(schema_editor):
+    vendor = schema_editor.connection.vendor
+    for sql in {'sqlite': SQLITE_DROP, 'postgresql': POSTGRES_DROP}.get(vendor, []):
+        schema_editor.execute(sql)
+
+
+def fts5_query(terms):
+    """
+    FTS5 MATCH expression requiring every word of ``terms``, or None if
+    there are none. Words are quoted so user input is never parsed as query
+    syntax; the porter tokenizer still matches other forms of each word.
+    """
+    words = WORD.findall(terms)
+    if not words:
+        return None
+    return ' '.join(f'"{word}"' for word in words)
+
+
+def matching(queryset, terms):
+    """Narrow a Quote ``queryset`` to quotes matching ``terms``, in no particular order"""
+    if connection.vendor == 'sqlite':
+        match = fts5_query(terms)
+        if match is None:
+            return queryset.none()
+        return queryset.filter(id__in=RawSQL(
+            'SELECT rowid FROM quotes_quote_fts WHERE quotes_quote_fts MATCH %s', [match]
+        ))
+    if connection.vendor == 'postgresql':
+        return queryset.filter(id__in=RawSQL(
+            "SELECT id FROM quotes_quote WHERE search_vector @@ websearch_to_tsquery('english', %s)", [terms]
+        ))
+    return queryset.filter(text__icontains=terms) | queryset.filter(author__icontains=terms)
+
+
+def ranked_quote_ids(terms, limit, offset=0):
+    """
+    IDs of active quotes matching ``terms``, best match first. Every match
+    is ranked and the page is cut in the database.
+    """
+    if connection.vendor == 'sqlite':
+        match = fts5_query(terms)
+        if match is None:
+            return []
+        sql = (
+            'SELECT q.id FROM quotes_quote_fts f JOIN quotes_quote q ON q.id = f.rowid '
+            'WHERE quotes_quote_fts MATCH %s AND q.is_active '
+            # Matches in the quote text weigh twice as much as matches in the author
+            'ORDER BY bm25(quotes_quote_fts, 2.0, 1.0), q.id DESC LIMIT %s OFFSET %s'
+        )
+        params = [match, limit, offset]
+    elif connection.vendor == 'postgresql':
+        sql = (
+            "SELECT id FROM quotes_quote, websearch_to_tsquery('english', %s) query "
+            'WHERE search_vector @@ query AND is_active '
+            'ORDER BY ts_rank(search_vector, query) DESC, id DESC LIMIT %s OFFSET %s'
+        )
+        params = [terms, limit, offset]
+    else:
+        ids = matching(Quote.objects.filter(is_active=True), terms).order_by('id').values_list('id', flat=True)
+        return list(ids[offset:offset + limit])
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [row[0] for row in cursor.fetchall()]
+
+
+def search_quotes(terms, page=1, page_size=20):
+    """
+    Active quotes matching ``terms``, best match first. Returns
+    ``(quotes, has_next)`` for the 1-based ``page``; pages past
+    SEARCH_MAX_PAGE are empty.
+    """
+    if page > settings.SEARCH_MAX_PAGE:
+        return [], False
+    # One row past the page tells us whether another page follows
+    quote_ids = ranked_quote_ids(terms, page_size + 1, (page - 1) * page_size)
+    has_next = len(quote_ids) > page_size and page < settings.SEARCH_MAX_PAGE
+    quote_ids = quote_ids[:page_size]
+    quotes = catalog.quotes(quote_ids)
+    return [quotes[quote_id] for quote_id in quote_ids if quote_id in quotes], has_next
@@ -0,0 +1,60 @@
+from datetime import timedelta
+
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models.signals import post_delete, post_migrate, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+from . import catalog, search
+from .models import REPEAT_WINDOW_DAYS, Category, Quote, User, UserQuoteHistory
+from .sampler import sampler
+
+
+@receiver(post_save, sender=Quote)
+@receiver(post_delete, sender=Quote)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_quote_catalog(sender, **kwargs):
+    """Retire the cached catalog and this process's quote pools so the next read sees the change"""
+    catalog.invalidate()
+    sampler.invalidate()
+
+
+@receiver(post_save, sender=UserQuoteHistory)
+def remember_sent_quote(sender, instance, created, **kwargs):
+    """Keep ``User.recent_quotes`` in step with history rows written one at a time"""
+    if not created:
+        return
+    user = User.objects.only('recent_quotes').get(id=instance.user_id)
+    user.remember_quote(instance.quote_id, instance.sent_at)
+    User.objects.filter(id=user.id).update(recent_quotes=user.recent_quotes)
+
+
+@receiver(post_delete, sender=UserQuoteHistory)
+def forget_deleted_quote(sender, instance, origin=None, **kwargs):
+    """
+    Drop a deleted history row from ``User.recent_quotes``. Rows deleted with
+    their user or quote are skipped (the user is gone, and a deleted quote
+    can never be picked again), as are rows already outside the window.
+    """
+    if isinstance(origin, (User, Quote)) or getattr(origin, 'model', None) in (User, Quote):
+        return
+    if instance.sent_at < timezone.now() - timedelta(days=REPEAT_WINDOW_DAYS):
+        return
+    recent = UserQuoteHistory.recent_quotes_for_users([instance.user_id])[instance.user_id]
+    User.objects.filter(id=instance.user_id).update(recent_quotes=recent)
+
+
+@receiver(post_migrate)
+def repair_search_index(sender, using=DEFAULT_DB_ALIAS, **kwargs):
+    """
+    Reinstall and repopulate the search index if a migration lost it:
+    SQLite drops the index triggers whenever it rebuilds the quote table.
+    """
+    if sender.name != 'quotes':
+        return
+    connection = connections[using]
+    if 'quotes_quote' not in connection.introspection.table_names() or search.is_installed(connection):
+        return
+    with connection.schema_editor() as schema_editor:
+        search.install(schema_editor, rebuild=True)
+
@@ -1,87 +1,138 @@
-from celery import shared_task
-from django.core.mail import send_mail
-from django.template.loader import render_to_string
+import logging
+import time
+from collections import Counter
+from datetime import datetime
+from types import SimpleNamespace
+from celery import chord, group, shared_task
+from celery.signals import worker_process_init
+from django.core.mail import EmailMultiAlternatives, get_connection, send_mail
+from django.template.defaultfilters import time as time_filter
+from django.template.loader import get_template, render_to_string
+from django.utils.html import escape
 from django.utils import timezone
 from django.conf import settings
-from datetime import datetime, timedelta
-from .models import User, UserQuoteHistory, UserPreference
+from . import metrics, queue
+from .delivery import (
+    deliver_chunk, dispatch_outbox, due_user_ranges, due_users, recompute_delivery_slots, skipped_users,
+    zones_changing_offset,
+)
+from .rollups import reconcile
+from .telegram import TelegramSender, build_quote_message
+
+logger = logging.getLogger(__name__)
 
 
 @shared_task
 def send_daily_quotes():
     """
     Celery task to send daily quotes to users based on their preferred time.
-    This task runs every hour and checks which users should receive quotes.
+    This task runs once per delivery tick (hourly by default) and fans the
+    due users out to parallel chunk tasks; the chord callback reports the
+    combined counts.
     """
-    current_time = timezone.now()
-    current_hour = current_time.hour
+    now = timezone.now()
+    minutes = settings.DELIVERY_TICK_MINUTES
+    with metrics.timer('cohort_select'):
+        ranges = due_user_ranges(now, minutes, settings.DELIVERY_CHUNK_SIZE)
+        for outcome, amount in skipped_users(now, minutes).items():
+            metrics.count(outcome, amount)
+    metrics.flush()
+    if not ranges:
+        return summarize_delivery([])
 
-    # Get all active users who haven't paused delivery
-    users = User.objects.filter(is_active=True)
+    header = group(
+        send_quote_chunk.s(first_id, last_id, now.isoformat(), minutes)
+        for first_id, last_id in ranges
+    )
+    chord(header)(summarize_delivery.s())
+    return f"Dispatched {len(ranges)} delivery chunks"
 
-    sent_count = 0
-    for user in users:
-        # Check if user has preferences
-        try:
-            preferences = user.preferences
-            if preferences.delivery_paused:
-                continue
-        except UserPreference.DoesNotExist:
-            # Create default preferences
-            UserPreference.objects.create(user=user)
-            preferences = user.preferences
 
-        # Check if it's time to send based on user's preferred time
-        preferred_hour = user.preferred_time.hour
-        if preferred_hour != current_hour:
-            continue
+@shared_task
+def send_quote_chunk(first_id, last_id, now, minutes=60):
+    """Deliver to the due users whose IDs fall in ``[first_id, last_id]``"""
+    now = datetime.fromisoformat(now)
+    try:
+        with metrics.timer('cohort_select'):
+            users = list(due_users(now, minutes).filter(id__range=(first_id, last_id)))
+        return dict(deliver_chunk(users, now))
+    finally:
+        metrics.flush()
 
-        # Check if user already received a quote today
-        today_start = current_time.replace(hour=0, minute=0, second=0, microsecond=0)
-        already_sent_today = UserQuoteHistory.objects.filter(
-            user=user,
-            sent_at__gte=today_start
-        ).exists()
 
-        if already_sent_today:
-            continue
+@shared_task
+def summarize_delivery(results):
+    """Chord callback aggregating the counts returned by each chunk"""
+    counts = Counter(sent=0, skipped=0, retrying=0, failed=0)
+    for result in results:
+        counts.update(result)
+    return (
+        f"Sent {counts['sent']} quotes successfully "
+        f"({counts['skipped']} skipped, {counts['retrying']} retrying, {counts['failed']} failed)"
+    )
 
-        # Get an unsent quote for this user
-        quote = UserQuoteHistory.get_unsent_quote_for_user(user)
 
-        if quote:
-            # Send email with quote
-            success = send_quote_email(user, quote)
+@shared_task
+def dispatch_delivery_outbox():
+    """Send outbox entries whose retry backoff has elapsed"""
+    try:
+        counts = dispatch_outbox()
+    finally:
+        metrics.flush()
+    return (
+        f"Sent {counts['sent']} queued quotes "
+        f"({counts['retrying']} retrying, {counts['failed']} failed)"
+    )
 
-            if success:
-                # Record in history
-                UserQuoteHistory.objects.create(user=user, quote=quote)
 
-                # Update last_quote_sent timestamp
-                user.last_quote_sent = current_time
-                user.save()
+EMAIL_TEMPLATE = 'quotes/email/daily_quote.html'
 
-                sent_count += 1
+# Stands in for the username while a quote's email body is rendered
+USERNAME_PLACEHOLDER = '__dailydose_username__'
 
-    return f"Sent {sent_count} quotes successfully"
 
+@worker_process_init.connect
+def warm_email_template(**kwargs):
+    """Compile the email template into the cached loader before the first delivery"""
+    get_template(EMAIL_TEMPLATE)
 
-def send_quote_email(user, quote):
+
+class QuoteEmailRenderer:
     """
-    Send a quote via email to a user
+    Renders each quote's email bodies once and reuses them for every
+    recipient, substituting only the username.
+
+    The HTML greeting depends on whether the user's preferred time is AM or
+    PM, so bodies are cached per quote and meridiem.
     """
-    try:
-        subject = 'Your Daily Motivation Quote'
+
+    def __init__(self):
+        self._bodies = {}
+
+    def render(self, user, quote):
+        """Return ``(html_message, plain_message)`` for ``user``"""
+        meridiem = time_filter(user.preferred_time, 'A')
+        key = (quote.pk, meridiem)
+        if key not in self._bodies:
+            self._bodies[key] = self._render_bodies(user, quote)
+        html_message, plain_message = self._bodies[key]
+        return (
+            html_message.replace(USERNAME_PLACEHOLDER, escape(user.username)),
+            plain_message.replace(USERNAME_PLACEHOLDER, user.username),
+        )
+
+    def _render_bodies(self, user, quote):
+        recipient = SimpleNamespace(username=USERNAME_PLACEHOLDER, preferred_time=user.preferred_time)
 
         # Render HTML email
-        html_message = render_to_string('quotes/email/daily_quote.html', {
-            'user': user,
+        html_message = render_to_string(EMAIL_TEMPLATE, {
+            'user': recipient,
             'quote': quote,
         })
 
         # Plain text fallback
         plain_message = f"""
-Hi {user.username},
+Hi {recipient.username},
 
 Here's your daily motivation quote:
 
@@ -95,20 +146,113 @@ Have a great day!
 
 DailyDose Team
         """
+        return html_message, plain_message
+
+
+def build_quote_email(user, quote, connection=None, renderer=None):
+    """Build the daily quote email for a user"""
+    html_message, plain_message = (renderer or QuoteEmailRenderer()).render(user, quote)
+    message = EmailMultiAlternatives(
+        subject='Your Daily Motivation Quote',
+        body=plain_message,
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        to=[user.email],
+        connection=connection,
+    )
+    message.attach_alternative(html_message, 'text/html')
+    return message
+
+
+def send_quote_email(user, quote):
+    """
+    Send a quote via email to a user. Errors propagate to the caller; the
+    delivery outbox retries failed sends with backoff.
+    """
+    message = build_quote_email(user, quote)
+    started = time.perf_counter()
+    message.send(fail_silently=False)
+    metrics.observe('email', time.perf_counter() - started)
 
-        send_mail(
-            subject=subject,
-            message=plain_message,
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            recipient_list=[user.email],
-            html_message=html_message,
-            fail_silently=False,
-        )
 
-        return True
+def send_quote_emails(deliveries, renderer=None):
+    """
+    Send quote emails for many ``(user, quote)`` pairs over one connection,
+    rendering each quote's body once (with ``renderer`` when given).
+
+    Each message is handed to the backend on its own: the SMTP and SendGrid
+    backends send one message per request and raise at the first failure,
+    so a failed batch could not tell which of its messages already went
+    out. Returns one entry per pair: ``None`` if it was sent, otherwise the
+    error. If the connection cannot be opened, every pair gets its error.
+    """
+    errors = [None] * len(deliveries)
+    if not deliveries:
+        return errors
+    renderer = renderer or QuoteEmailRenderer()
+    sent = [False] * len(deliveries)
+    try:
+        connection = get_connection(fail_silently=False)
+        with connection:
+            for index, (user, quote) in enumerate(deliveries):
+                try:
+                    with metrics.timer('render'):
+                        message = build_quote_email(user, quote, connection, renderer)
+                    with metrics.timer('send'):
+                        started = time.perf_counter()
+                        connection.send_messages([message])
+                    metrics.observe('email', time.perf_counter() - started)
+                    sent[index] = True
+                except Exception as e:
+                    logger.warning("Failed to send email to %s: %s", user.email, e)
+                    errors[index] = str(e)
     except Exception as e:
-        print(f"Failed to send email to {user.email}: {str(e)}")
-        return False
+        logger.warning("Email connection failed: %s", e)
+        for index, delivered in enumerate(sent):
+            if not delivered and errors[index] is None:
+                errors[index] = f'Email connection failed: {e}'
+    return errors
+
+
+def send_quote_telegrams(deliveries):
+    """
+    Send quotes to Telegram for many ``(user, quote)`` pairs concurrently.
+    Returns whether each pair was delivered, in order.
+    """
+    if not deliveries:
+        return []
+
+    texts = {}
+    messages = []
+    with metrics.timer('render'):
+        for user, quote in deliveries:
+            if quote.pk not in texts:
+                texts[quote.pk] = build_quote_message(quote)
+            messages.append((user.telegram_chat_id, texts[quote.pk]))
+
+    with metrics.timer('send'):
+        return TelegramSender().send(messages)
+
+
+@shared_task
+def refill_quote_queues():
+    """Pick every active user's upcoming quotes ahead of the delivery ticks"""
+    queued = queue.refill_queues()
+    return f"Queued {queued} quotes"
+
+
+@shared_task
+def refresh_delivery_slots():
+    """Move the delivery slots of users whose time zone is around a DST transition"""
+    zones = zones_changing_offset(timezone.now())
+    updated = recompute_delivery_slots(zones) if zones else 0
+    return f"Updated delivery slots for {updated} users in {len(zones)} time zones"
+
+
+@shared_task
+def reconcile_analytics_rollups():
+    """Rebuild the analytics counters from the history tables to correct drift"""
+    counts = reconcile()
+    return f"Reconciled rollups for {counts['days']} days, {counts['categories']} categories and {counts['quotes']} quotes"
 
 
 @shared_task
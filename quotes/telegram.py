@@ -0,0 +1,171 @@
+"""
+Telegram Bot API delivery channel.
+
+Messages are sent concurrently from one asyncio event loop over a pooled
+HTTP client. A limiter shared through the cache keeps every worker together
+under Telegram's global rate limit, a token bucket per chat keeps us under
+the per-chat one, and a 429 only delays the message it was returned for.
+"""
+import asyncio
+import logging
+import time
+
+import httpx
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.html import escape
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+
+def build_quote_message(quote):
+    """Telegram HTML message text for a quote"""
+    return (
+        f'<i>"{escape(quote.text)}"</i>\n'
+        f'- <b>{escape(quote.author)}</b>\n\n'
+        f'#{escape(quote.category.name).replace(" ", "")}'
+    )
+
+
+class TokenBucket:
+    """Allows ``rate`` acquisitions per second with bursts of up to ``capacity``"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class SharedRateLimiter:
+    """
+    Allows ``rate`` acquisitions per second across every process sharing the
+    cache (Redis in production), counted in fixed windows of at least a second
+    """
+
+    def __init__(self, rate, key='telegram:global'):
+        self.key = key
+        self.period = max(1.0, 1 / rate)
+        self.limit = rate * self.period
+
+    async def reserve(self):
+        """Take a slot in the current window, or return the seconds until the next one"""
+        now = time.time()
+        window = int(now // self.period)
+        key = f'{self.key}:{window}'
+        await cache.aadd(key, 0, timeout=int(self.period) + 1)
+        if await cache.aincr(key) <= self.limit:
+            return 0
+        return (window + 1) * self.period - now
+
+    async def acquire(self):
+        while wait := await self.reserve():
+            await asyncio.sleep(wait)
+
+
+class TelegramSender:
+    """
+    Sends messages through the Bot API ``sendMessage`` method.
+
+    At most ``concurrency`` requests are in flight at once. A 429 response
+    puts that message to sleep for the ``retry_after`` Telegram asks for
+    while the other sends carry on.
+    """
+
+    # httpcore's pool bookkeeping grows quadratically with its size, so large
+    # concurrency is spread over several clients of this many connections
+    connections_per_client = 16
+
+    def __init__(self, token=None, api_url=None, concurrency=None,
+                 global_rate=None, per_chat_rate=None, max_retries=3):
+        self.token = token or settings.TELEGRAM_BOT_TOKEN
+        self.api_url = (api_url or settings.TELEGRAM_API_URL).rstrip('/')
+        self.concurrency = concurrency or settings.TELEGRAM_CONCURRENCY
+        self.global_rate = global_rate or settings.TELEGRAM_GLOBAL_RATE
+        self.per_chat_rate = per_chat_rate or settings.TELEGRAM_PER_CHAT_RATE
+        self.max_retries = max_retries
+
+    def send(self, messages):
+        """
+        Send ``(chat_id, text)`` pairs and return the list of booleans saying
+        which ones were delivered, in the same order.
+        """
+        if not messages:
+            return []
+        return asyncio.run(self.send_many(messages))
+
+    async def send_many(self, messages):
+        self._global_limiter = SharedRateLimiter(self.global_rate)
+        self._chat_buckets = {}
+        self._slots = asyncio.Semaphore(self.concurrency)
+        size = min(self.concurrency, self.connections_per_client)
+        limits = httpx.Limits(max_connections=size, max_keepalive_connections=size)
+        clients = [
+            httpx.AsyncClient(
+                base_url=f'{self.api_url}/bot{self.token}',
+                limits=limits,
+                timeout=settings.TELEGRAM_TIMEOUT,
+            )
+            for _ in range(-(-self.concurrency // size))
+        ]
+        try:
+            return await asyncio.gather(*(
+                self._send(clients[i % len(clients)], chat_id, text)
+                for i, (chat_id, text) in enumerate(messages)
+            ))
+        finally:
+            for client in clients:
+                await client.aclose()
+
+    async def _send(self, client, chat_id, text):
+        started = time.perf_counter()
+        delivered = await self._deliver(client, chat_id, text)
+        # Includes rate-limit waits and retries: the time until the message went out or was given up
+        metrics.observe('telegram', time.perf_counter() - started)
+        return delivered
+
+    async def _deliver(self, client, chat_id, text):
+        chat_bucket = self._chat_buckets.setdefault(chat_id, TokenBucket(self.per_chat_rate, 1))
+        for attempt in range(self.max_retries + 1):
+            await chat_bucket.acquire()
+            async with self._slots:
+                # Wait for the global limit inside the slot so at most `concurrency` sends poll the cache
+                await self._global_limiter.acquire()
+                try:
+                    response = await client.post('/sendMessage', json={
+                        'chat_id': chat_id,
+                        'text': text,
+                        'parse_mode': 'HTML',
+                    })
+                except httpx.HTTPError as e:
+                    response = None
+                    error = e
+
+            if response is None:
+                logger.warning("Failed to send Telegram message to %s: %r", chat_id, error)
+                await asyncio.sleep(2 ** attempt)
+                continue
+            if response.status_code == 429:
+                # Sleep outside the concurrency slot so other chats keep sending
+                try:
+                    retry_after = response.json()['parameters']['retry_after']
+                except (ValueError, KeyError, TypeError):
+                    retry_after = 1
+                await asyncio.sleep(retry_after)
+                continue
+            if response.is_success:
+                return True
+            logger.warning("Failed to send Telegram message to %s: %s %s", chat_id, response.status_code, response.text)
+            return False
+        return False
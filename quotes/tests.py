@@ -1,3 +1,873 @@
-from django.test import TestCase
+import asyncio
+import importlib
+import io
+import random
+from collections import Counter
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+from unittest import mock
 
-# Create your tests here.
+from django.apps import apps
+from django.core import mail
+from django.core.cache import cache
+from django.core.mail.backends import locmem
+from django.core.management import call_command
+from django.core.management.sql import emit_post_migrate_signal
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from . import catalog, metrics, profiling, queue, search
+from .benchmarks import FakeBotAPIServer
+from .delivery import deliver_chunk, dispatch_outbox, due_users, enqueue_chunk, recompute_delivery_slots, zones_changing_offset
+from .forms import QuoteAdminForm, UserPreferenceForm
+from .importer import QuoteImporter, read_rows
+from .models import (
+    ArchivedQuoteHistory, Category, CategoryStats, DailyStats, DeliveryOutbox, QueuedQuote, Quote, QuoteStats, User,
+    UserPreference, UserQuoteHistory, delivery_slot_for,
+)
+from .normalization import content_hash
+from .rollups import reconcile
+from .sampler import QuoteSampler
+from .search import search_quotes
+from .tasks import send_daily_quotes, send_quote_emails, summarize_delivery
+from .telegram import SharedRateLimiter, TelegramSender
+
+
+class FailingEmailBackend(locmem.EmailBackend):
+    """Locmem backend that, like SMTP, sends one message at a time and raises at the first refused recipient"""
+    refused = set()
+
+    def send_messages(self, messages):
+        for message in messages:
+            if set(message.to) & self.refused:
+                raise ValueError(f'Recipient refused: {message.to[0]}')
+            super().send_messages([message])
+        return len(messages)
+
+
+class UnreachableEmailBackend(locmem.EmailBackend):
+    """Locmem backend whose connection cannot be opened, like SMTP pointed at a closed port"""
+
+    def open(self):
+        raise ConnectionRefusedError(111, 'Connection refused')
+
+
+class TelegramSenderTests(TestCase):
+    def test_retries_after_rate_limit_without_losing_messages(self):
+        messages = [(1000 + i, f'Message {i}') for i in range(12)]
+        with FakeBotAPIServer(rate_limit_every=4, retry_after=0) as server:
+            sender = TelegramSender(token='test', api_url=server.url, concurrency=4, global_rate=1000)
+            results = sender.send(messages)
+
+        self.assertEqual(results, [True] * len(messages))
+        self.assertEqual(sorted(m['chat_id'] for m in server.messages), [chat_id for chat_id, _ in messages])
+
+    def test_global_limit_is_shared_between_senders(self):
+        cache.clear()
+        first, second = SharedRateLimiter(3), SharedRateLimiter(3)
+        with mock.patch('quotes.telegram.time.time', return_value=1000.25):
+            waits = [asyncio.run(limiter.reserve()) for limiter in (first, second, first, second)]
+        self.assertEqual(waits, [0, 0, 0, 0.75])
+
+
+@override_settings(
+    EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+    CELERY_TASK_ALWAYS_EAGER=True,
+)
+class TelegramDeliveryTests(TestCase):
+    def setUp(self):
+        category = Category.objects.create(name='Success', slug='success')
+        Quote.objects.create(text='Keep going.', author='Someone', category=category)
+        now = timezone.now()
+        self.user = User.objects.create(
+            username='alice', email='alice@example.com', telegram_chat_id=42,
+            preferred_time=time(now.hour, now.minute),
+        )
+        UserPreference.objects.create(user=self.user, email_enabled=False, telegram_enabled=True)
+
+    def test_telegram_only_user_is_served_on_telegram(self):
+        with FakeBotAPIServer() as server, override_settings(TELEGRAM_API_URL=server.url):
+            send_daily_quotes()
+
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual([m['chat_id'] for m in server.messages], [42])
+        self.assertEqual(UserQuoteHistory.objects.filter(user=self.user).count(), 1)
+
+
+@override_settings(
+    EMAIL_BACKEND='quotes.tests.FailingEmailBackend',
+    CELERY_TASK_ALWAYS_EAGER=True,
+    OUTBOX_RETRY_BASE_SECONDS=60,
+    OUTBOX_MAX_ATTEMPTS=3,
+)
+class DeliveryOutboxTests(TestCase):
+    def setUp(self):
+        category = Category.objects.create(name='Success', slug='success')
+        Quote.objects.create(text='Keep going.', author='Someone', category=category)
+        now = timezone.now()
+        self.user = User.objects.create(username='alice', email='alice@example.com', preferred_time=time(now.hour, now.minute))
+        self.addCleanup(FailingEmailBackend.refused.clear)
+
+    def entry(self):
+        return DeliveryOutbox.objects.get(user=self.user)
+
+    def test_delivery_is_not_repeated_the_same_day(self):
+        send_daily_quotes()
+        send_daily_quotes()
+        enqueue_chunk([self.user], timezone.now())
+        dispatch_outbox()
+
+        self.assertEqual(DeliveryOutbox.objects.filter(user=self.user).count(), 1)
+        self.assertEqual(self.entry().status, DeliveryOutbox.SENT)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(UserQuoteHistory.objects.filter(user=self.user).count(), 1)
+
+    def test_failed_sends_back_off_then_fail(self):
+        FailingEmailBackend.refused.add(self.user.email)
+        send_daily_quotes()
+        for attempt in (1, 2):
+            entry = self.entry()
+            self.assertEqual((entry.status, entry.attempts), (DeliveryOutbox.PENDING, attempt))
+            self.assertIn('Recipient refused', entry.last_error)
+            self.assertIsNone(entry.leased_until)
+            # The backoff is counted from when the outcome was recorded
+            delay = timedelta(seconds=60 * 2 ** (attempt - 1))
+            self.assertAlmostEqual(entry.next_attempt_at, timezone.now() + delay, delta=timedelta(seconds=5))
+            self.assertEqual(dispatch_outbox(timezone.now())['sent'], 0)
+            dispatch_outbox(entry.next_attempt_at)
+
+        entry = self.entry()
+        self.assertEqual((entry.status, entry.attempts), (DeliveryOutbox.FAILED, 3))
+        self.assertFalse(UserQuoteHistory.objects.filter(user=self.user).exists())
+        self.assertEqual(len(mail.outbox), 0)
+
+    @override_settings(EMAIL_BACKEND='quotes.tests.UnreachableEmailBackend')
+    def test_connection_failure_is_retried(self):
+        enqueue_chunk([self.user], timezone.now())
+        self.assertEqual(dispatch_outbox(), {'sent': 0, 'retrying': 1, 'failed': 0})
+
+        entry = self.entry()
+        self.assertEqual((entry.status, entry.attempts), (DeliveryOutbox.PENDING, 1))
+        self.assertIn('Connection refused', entry.last_error)
+        self.assertGreater(entry.next_attempt_at, timezone.now())
+
+    def test_expired_lease_is_not_sent_again(self):
+        enqueue_chunk([self.user], timezone.now())
+        DeliveryOutbox.objects.update(status=DeliveryOutbox.SENDING, leased_until=timezone.now() - timedelta(seconds=1))
+        dispatch_outbox()
+
+        self.assertEqual(self.entry().status, DeliveryOutbox.UNKNOWN)
+        self.assertEqual(len(mail.outbox), 0)
+
+
+@override_settings(EMAIL_BACKEND='quotes.tests.FailingEmailBackend')
+class QuoteEmailTests(TestCase):
+    def test_failure_midway_does_not_resend_delivered_emails(self):
+        category = Category.objects.create(name='Success', slug='success')
+        quote = Quote.objects.create(text='Keep going.', author='Someone', category=category)
+        users = [User.objects.create(username=f'user{i}', email=f'user{i}@example.com') for i in range(4)]
+        FailingEmailBackend.refused.add('user2@example.com')
+        self.addCleanup(FailingEmailBackend.refused.clear)
+
+        errors = send_quote_emails([(user, quote) for user in users])
+        self.assertEqual([error is None for error in errors], [True, True, False, True])
+        self.assertEqual([message.to[0] for message in mail.outbox], ['user0@example.com', 'user1@example.com', 'user3@example.com'])
+
+
+@override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend')
+class DeliverChunkTests(TestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name='Success', slug='success')
+        for i in range(5):
+            Quote.objects.create(text=f'Quote {i}', author='Someone', category=self.category)
+        self.now = timezone.now()
+
+    def due(self, names):
+        for name in names:
+            user = User.objects.create(username=name, email=f'{name}@example.com', preferred_time=time(self.now.hour, self.now.minute))
+            UserPreference.objects.create(user=user).preferred_categories.set([self.category])
+        return list(due_users(self.now).filter(username__in=names))
+
+    def test_query_count_does_not_grow_with_the_chunk(self):
+        # The first chunk also loads the quote catalog into the cache
+        deliver_chunk(self.due(['warm']), self.now)
+        one, many = self.due(['alice']), self.due([f'user{i}' for i in range(20)])
+        with CaptureQueriesContext(connection) as single:
+            self.assertEqual(deliver_chunk(one, self.now)['sent'], 1)
+        with self.assertNumQueries(len(single)):
+            self.assertEqual(deliver_chunk(many, self.now)['sent'], 20)
+        self.assertEqual(len(mail.outbox), 22)
+
+    def test_chord_callback_adds_up_the_chunks(self):
+        self.assertEqual(
+            summarize_delivery([{'sent': 3, 'skipped': 1}, {'sent': 2, 'retrying': 1, 'failed': 1}, {}]),
+            'Sent 5 quotes successfully (1 skipped, 1 retrying, 1 failed)',
+        )
+
+
+@override_settings(DELIVERY_JITTER_MINUTES=0, DELIVERY_CATCH_UP_MINUTES=60)
+class DueUsersTests(TestCase):
+    def test_late_tick_catches_up_earlier_slots(self):
+        user = User.objects.create(username='dave', email='dave@example.com', preferred_time=time(8, 59))
+        day = datetime(2024, 5, 1, tzinfo=dt_timezone.utc)
+        self.assertIn(user, due_users(day.replace(hour=9, minute=1), minutes=1))
+        self.assertNotIn(user, due_users(day.replace(hour=10, minute=1), minutes=1))
+
+        User.objects.filter(id=user.id).update(last_quote_sent=day.replace(hour=9))
+        self.assertNotIn(user, due_users(day.replace(hour=9, minute=1), minutes=1))
+
+
+@override_settings(
+    EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+    CELERY_TASK_ALWAYS_EAGER=True,
+)
+class DeliveryMetricsTests(TestCase):
+    def setUp(self):
+        metrics.reset()
+        category = Category.objects.create(name='Success', slug='success')
+        Quote.objects.create(text='Keep going.', author='Someone', category=category)
+        now = timezone.now()
+        for name in ('alice', 'bob', 'carol'):
+            User.objects.create(username=name, email=f'{name}@example.com', preferred_time=time(now.hour, now.minute))
+        UserPreference.objects.create(user=User.objects.get(username='carol'), delivery_paused=True)
+
+    def test_runs_are_counted_and_exposed(self):
+        send_daily_quotes()
+        send_daily_quotes()
+
+        staff = User.objects.create(username='staff', is_staff=True)
+        self.client.force_login(staff)
+        body = self.client.get(reverse('delivery_metrics')).content.decode()
+        self.assertIn('dailydose_deliveries_total{outcome="sent"} 2', body)
+        self.assertIn('dailydose_deliveries_total{outcome="skipped_paused"} 2', body)
+        self.assertIn('dailydose_deliveries_total{outcome="skipped_already_sent"} 2', body)
+        self.assertIn('dailydose_send_latency_seconds_count{channel="email"} 2', body)
+        # Once per run plus once for the one chunk the first run dispatched
+        self.assertIn('dailydose_delivery_stage_seconds_count{stage="cohort_select"} 3', body)
+
+    def test_endpoint_requires_staff(self):
+        self.client.force_login(User.objects.get(username='alice'))
+        self.assertEqual(self.client.get(reverse('delivery_metrics')).status_code, 302)
+
+
+class RecentQuotesTests(TestCase):
+    def setUp(self):
+        category = Category.objects.create(name='Success', slug='success')
+        self.quotes = [Quote.objects.create(text=f'Quote {i}', author='Someone', category=category) for i in range(3)]
+        self.user = User.objects.create(username='erin', email='erin@example.com')
+
+    def test_remember_quote_prunes_entries_outside_the_window(self):
+        now = timezone.now()
+        today = now.date().toordinal()
+        self.user.recent_quotes = [[self.quotes[0].id, today - 31], [self.quotes[1].id, today - 5]]
+        self.user.remember_quote(self.quotes[2].id, now)
+        self.assertEqual(self.user.recent_quotes, [[self.quotes[1].id, today - 5], [self.quotes[2].id, today]])
+        self.assertEqual(self.user.get_recent_quote_ids(now), {self.quotes[1].id, self.quotes[2].id})
+
+    def test_single_history_writes_and_deletes_update_the_list(self):
+        history = UserQuoteHistory.objects.create(user=self.user, quote=self.quotes[0])
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.get_recent_quote_ids(), {self.quotes[0].id})
+
+        history.delete()
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.recent_quotes, [])
+
+    def test_deleting_a_user_does_not_recompute_per_history_row(self):
+        category = self.quotes[0].category
+        many = User.objects.create(username='frank', email='frank@example.com')
+        UserQuoteHistory.objects.create(user=self.user, quote=self.quotes[0])
+        UserQuoteHistory.objects.bulk_create([
+            UserQuoteHistory(user=many, quote=Quote.objects.create(text=f'Extra {i}', author='Someone', category=category))
+            for i in range(40)
+        ])
+
+        with CaptureQueriesContext(connection) as one_row:
+            self.user.delete()
+        with CaptureQueriesContext(connection) as many_rows:
+            many.delete()
+        self.assertEqual(len(many_rows), len(one_row))
+
+    def test_rebuild_command_and_migration_backfill_from_history(self):
+        for quote in self.quotes[:2]:
+            UserQuoteHistory.objects.create(user=self.user, quote=quote)
+        expected = {self.quotes[0].id, self.quotes[1].id}
+
+        User.objects.update(recent_quotes=[])
+        call_command('rebuild_recent_quotes', stdout=io.StringIO())
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.get_recent_quote_ids(), expected)
+
+        User.objects.update(recent_quotes=[])
+        importlib.import_module('quotes.migrations.0003_user_recent_quotes').backfill_recent_quotes(apps, None)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.get_recent_quote_ids(), expected)
+
+
+@override_settings(
+    EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+    CELERY_TASK_ALWAYS_EAGER=True,
+    QUOTE_QUEUE_SIZE=3,
+)
+class QuoteQueueTests(TestCase):
+    def setUp(self):
+        self.categories = [Category.objects.create(name=f'Category {i}', slug=f'category-{i}') for i in range(2)]
+        self.quotes = [
+            Quote.objects.create(text=f'Quote {i}', author='Someone', category=self.categories[i % 2])
+            for i in range(10)
+        ]
+        now = timezone.now()
+        self.user = User.objects.create(username='dave', email='dave@example.com', preferred_time=time(now.hour, now.minute))
+        self.preference = UserPreference.objects.create(user=self.user)
+        self.preference.preferred_categories.set([self.categories[0]])
+
+    def queued(self):
+        return list(QueuedQuote.objects.filter(user=self.user).values_list('quote_id', flat=True))
+
+    def test_delivery_pops_the_head_of_the_queue(self):
+        UserQuoteHistory.objects.create(user=self.user, quote=self.quotes[0])
+        self.user.refresh_from_db()
+        queue.refill_queues()
+        queued = self.queued()
+        self.assertEqual(len(queued), 3)
+        self.assertNotIn(self.quotes[0].id, queued)
+        self.assertTrue(all(Quote.objects.get(id=quote_id).category == self.categories[0] for quote_id in queued))
+
+        User.objects.filter(id=self.user.id).update(last_quote_sent=None)
+        send_daily_quotes()
+        self.assertEqual(UserQuoteHistory.objects.filter(user=self.user).latest('id').quote_id, queued[0])
+        self.assertEqual(self.queued(), queued[1:])
+
+    @override_settings(EMAIL_BACKEND='quotes.tests.FailingEmailBackend')
+    def test_ticks_do_not_pop_for_users_already_in_the_outbox(self):
+        FailingEmailBackend.refused.add(self.user.email)
+        self.addCleanup(FailingEmailBackend.refused.clear)
+        queue.refill_queues()
+        for _ in range(4):
+            send_daily_quotes()
+        self.assertEqual(DeliveryOutbox.objects.filter(user=self.user).count(), 1)
+        self.assertEqual(len(self.queued()), 2)
+
+    def test_category_changes_and_deactivation_invalidate_queues(self):
+        queue.refill_queues()
+        form = UserPreferenceForm(
+            {'preferred_categories': [self.categories[1].id], 'preferred_time': '08:00', 'email_enabled': True},
+            instance=self.preference,
+        )
+        self.assertTrue(form.is_valid(), form.errors)
+        form.save()
+        queued = self.queued()
+        self.assertEqual({Quote.objects.get(id=quote_id).category for quote_id in queued}, {self.categories[1]})
+
+        staff = User.objects.create(username='staff', is_staff=True, is_superuser=True)
+        self.client.force_login(staff)
+        quote = Quote.objects.get(id=queued[0])
+        self.client.post(reverse('admin:quotes_quote_change', args=[quote.id]), {
+            'text': quote.text, 'author': quote.author, 'category': quote.category_id,
+        })
+        self.assertFalse(Quote.objects.get(id=quote.id).is_active)
+        self.assertEqual(self.queued(), queued[1:])
+
+
+@override_settings(DELIVERY_JITTER_MINUTES=0)
+class TimezoneSlotTests(TestCase):
+    # US daylight saving time ended at 06:00 UTC on 2024-11-03
+    BEFORE_DST_END = datetime(2024, 11, 2, 10, 0, tzinfo=dt_timezone.utc)
+    AFTER_DST_END = datetime(2024, 11, 3, 14, 0, tzinfo=dt_timezone.utc)
+
+    def test_local_time_follows_the_next_occurrences_offset(self):
+        self.assertEqual(delivery_slot_for(time(8, 0), 'erin', 'America/New_York', self.BEFORE_DST_END), 12 * 60)
+        self.assertEqual(delivery_slot_for(time(8, 0), 'erin', 'America/New_York', self.AFTER_DST_END), 13 * 60)
+        self.assertEqual(delivery_slot_for(time(8, 0), 'erin', 'UTC', self.AFTER_DST_END), 8 * 60)
+
+    def test_recompute_moves_only_zones_changing_offset(self):
+        erin = User.objects.create(username='erin', preferred_time=time(8, 0), timezone='America/New_York')
+        frank = User.objects.create(username='frank', preferred_time=time(8, 0), timezone='Asia/Tokyo')
+        User.objects.filter(id=erin.id).update(delivery_slot=12 * 60)
+
+        zones = zones_changing_offset(self.AFTER_DST_END)
+        self.assertEqual(zones, ['America/New_York'])
+        self.assertEqual(recompute_delivery_slots(zones, now=self.AFTER_DST_END), 1)
+        self.assertEqual(User.objects.get(id=erin.id).delivery_slot, 13 * 60)
+        self.assertEqual(User.objects.get(id=frank.id).delivery_slot, 23 * 60)
+        self.assertEqual(list(due_users(datetime(2024, 11, 4, 13, 0, tzinfo=dt_timezone.utc))), [erin])
+
+    def test_preferences_form_sets_the_time_zone(self):
+        user = User.objects.create(username='erin', email='erin@example.com', preferred_time=time(8, 0))
+        preference = UserPreference.objects.create(user=user)
+        form = UserPreferenceForm(
+            {'preferred_time': '08:00', 'timezone': 'Asia/Tokyo', 'email_enabled': True}, instance=preference,
+        )
+        self.assertTrue(form.is_valid(), form.errors)
+        form.save()
+        user.refresh_from_db()
+        self.assertEqual((user.timezone, user.delivery_slot), ('Asia/Tokyo', 23 * 60))
+
+    def test_dashboard_shows_the_users_time_zone(self):
+        user = User.objects.create(username='erin', preferred_time=time(8, 0), timezone='Asia/Tokyo')
+        self.client.force_login(user)
+        self.assertContains(self.client.get(reverse('dashboard')), 'Delivery Time (Asia/Tokyo)')
+
+    def test_command_recomputes_every_user(self):
+        user = User.objects.create(username='erin', preferred_time=time(8, 0), timezone='Europe/Berlin')
+        User.objects.filter(id=user.id).update(delivery_slot=0)
+        out = io.StringIO()
+        call_command('recompute_delivery_slots', stdout=out)
+        self.assertIn('Updated delivery slots for 1 users', out.getvalue())
+        self.assertIn(User.objects.get(id=user.id).delivery_slot, (6 * 60, 7 * 60))
+
+
+class FixedSampler(QuoteSampler):
+    def load(self):
+        # Unequal categories, so a per-category draw would not be uniform per quote
+        return {1: list(range(1, 6)), 2: list(range(6, 21))}
+
+
+class QuoteSamplerTests(SimpleTestCase):
+    def setUp(self):
+        self.sampler = FixedSampler()
+
+    def test_draws_skip_excluded_ids_and_other_categories(self):
+        rng = random.Random(1)
+        draws = {self.sampler.sample([1], exclude={1, 2}, rng=rng) for _ in range(200)}
+        self.assertEqual(draws, {3, 4, 5})
+        draws = {self.sampler.sample([2], rng=rng) for _ in range(500)}
+        self.assertEqual(draws, set(range(6, 21)))
+
+    def test_mostly_excluded_pool_falls_back_to_a_scan(self):
+        exclude = set(range(1, 21)) - {17}
+        for seed in range(20):
+            self.assertEqual(self.sampler.sample(exclude=exclude, rng=random.Random(seed)), 17)
+        self.assertIsNone(self.sampler.sample(exclude=set(range(1, 21))))
+        self.assertIsNone(self.sampler.sample([3]))
+
+    def test_draws_are_uniform_across_quotes(self):
+        rng = random.Random(42)
+        counts = Counter(self.sampler.sample([1, 2], rng=rng) for _ in range(20000))
+        self.assertEqual(set(counts), set(range(1, 21)))
+        for quote_id, times in counts.items():
+            self.assertAlmostEqual(times, 1000, delta=150, msg=f'quote {quote_id}')
+
+
+class CohortAssignmentTests(TestCase):
+    def test_cohort_shares_quotes_outside_each_users_history(self):
+        category = Category.objects.create(name='Success', slug='success')
+        first, second = (Quote.objects.create(text=f'Quote {i}', author='Someone', category=category) for i in range(2))
+        users = [User.objects.create(username=f'user{i}', email=f'user{i}@example.com') for i in range(5)]
+        for user in users:
+            UserPreference.objects.create(user=user).preferred_categories.set([category])
+        UserQuoteHistory.objects.create(user=users[0], quote=first)
+        users = list(User.objects.filter(id__in=[user.id for user in users]).order_by('id'))
+
+        chosen = UserQuoteHistory.get_unsent_quotes_for_users(users)
+        self.assertEqual(chosen[users[0].id], second)
+        self.assertEqual(len({chosen[user.id] for user in users[1:]}), 1)
+
+
+class DashboardTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='bob', email='bob@example.com')
+        categories = [Category.objects.create(name=f'Category {i}', slug=f'category-{i}') for i in range(3)]
+        quotes = [
+            Quote.objects.create(text=f'Quote {i}', author=f'Author {i}', category=categories[i % 3])
+            for i in range(40)
+        ]
+        UserQuoteHistory.objects.bulk_create(
+            UserQuoteHistory(user=self.user, quote=quote, is_favorite=i % 4 == 0)
+            for i, quote in enumerate(quotes)
+        )
+        self.client.force_login(self.user)
+
+    def test_query_count_does_not_grow_with_history(self):
+        # session, user, history totals, recent, favorites, archived count
+        with self.assertNumQueries(6):
+            response = self.client.get(reverse('dashboard'))
+        self.assertContains(response, 'Quote 39')
+        self.assertEqual(response.context['dashboard_content'].count('quote-card'), 10)
+
+        # session and user only; the body comes from the cache
+        with self.assertNumQueries(2):
+            self.client.get(reverse('dashboard'))
+
+    def test_toggling_a_favorite_refreshes_the_dashboard(self):
+        self.client.get(reverse('dashboard'))
+        history = UserQuoteHistory.objects.filter(user=self.user, is_favorite=False).first()
+        self.client.post(reverse('toggle_favorite', args=[history.id]))
+
+        response = self.client.get(reverse('dashboard'))
+        self.assertContains(response, '<h3 class="card-title">11</h3>', html=False)
+
+
+@override_settings(
+    EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+    CELERY_TASK_ALWAYS_EAGER=True,
+)
+class QueryProfilingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.staff = User.objects.create(username='staff', is_staff=True)
+        category = Category.objects.create(name='Success', slug='success')
+        quote = Quote.objects.create(text='Keep going.', author='Someone', category=category)
+        UserQuoteHistory.objects.create(user=self.staff, quote=quote)
+        self.client.force_login(self.staff)
+
+    def test_header_profiles_one_staff_request(self):
+        response = self.client.get(reverse('dashboard'), HTTP_X_QUERY_PROFILE='1')
+        self.assertEqual(response['X-Query-Count'], '6')
+        self.assertEqual(self.client.get(reverse('dashboard')).get('X-Query-Count'), None)
+
+        row, = profiling.summary()
+        self.assertEqual((row['name'], row['runs'], row['queries']), ('dashboard', 1, 6))
+
+    @override_settings(QUERY_PROFILING=True, QUERY_BUDGET_QUERIES=3, QUERY_PROFILING_REPEATS=2)
+    def test_over_budget_requests_and_tasks_are_logged(self):
+        with self.assertLogs('quotes.profiling', 'WARNING') as logs:
+            self.client.get(reverse('dashboard'))
+        self.assertIn('GET /dashboard/ (dashboard) ran 6 queries', logs.output[0])
+
+        send_daily_quotes.delay()
+        names = {row['name']: row for row in profiling.summary()}
+        self.assertEqual(names['dashboard']['over_budget'], 1)
+        self.assertEqual(names['task:quotes.tasks.send_daily_quotes']['runs'], 1)
+
+        response = self.client.get(reverse('query_profile'))
+        self.assertContains(response, 'task:quotes.tasks.send_daily_quotes')
+
+
+@override_settings(HISTORY_PAGE_SIZE=7)
+class HistoryPaginationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='carol', email='carol@example.com')
+        category = Category.objects.create(name='Wisdom', slug='wisdom')
+        quotes = [
+            Quote.objects.create(text=f'Quote {i}', author='Someone', category=category)
+            for i in range(20)
+        ]
+        UserQuoteHistory.objects.bulk_create(
+            UserQuoteHistory(user=self.user, quote=quote) for quote in quotes
+        )
+        # Ties on sent_at must be broken by id without skipping or repeating rows
+        UserQuoteHistory.objects.filter(quote__in=quotes[5:15]).update(sent_at=timezone.now())
+        self.client.force_login(self.user)
+
+    def test_pages_cover_history_once_newest_first(self):
+        response = self.client.get(reverse('quote_history'))
+        seen = [history.id for history in response.context['quotes']]
+        cursor = response.context['next_cursor']
+        while cursor:
+            response = self.client.get(reverse('quote_history_page'), {'cursor': cursor}, HTTP_HX_REQUEST='true')
+            seen += [history.id for history in response.context['quotes']]
+            cursor = response.context['next_cursor']
+
+        expected = list(
+            UserQuoteHistory.objects.filter(user=self.user).order_by('-sent_at', '-id').values_list('id', flat=True)
+        )
+        self.assertEqual(seen, expected)
+
+    def test_pages_continue_into_the_archive(self):
+        now = timezone.now()
+        history = UserQuoteHistory.objects.filter(user=self.user).order_by('id')
+        UserQuoteHistory.objects.filter(id=history[0].id).update(sent_at=now - timedelta(days=400), is_favorite=True)
+        archived = [
+            ArchivedQuoteHistory.objects.create(user=self.user, quote=history[i].quote, sent_at=now - timedelta(days=days))
+            for i, days in ((1, 200), (2, 500))
+        ]
+
+        response = self.client.get(reverse('quote_history'))
+        seen = list(response.context['quotes'])
+        while response.context['next_cursor']:
+            response = self.client.get(
+                reverse('quote_history_page'), {'cursor': response.context['next_cursor']}, HTTP_HX_REQUEST='true',
+            )
+            seen += response.context['quotes']
+
+        self.assertEqual(len(seen), 22)
+        self.assertEqual([row.sent_at for row in seen], sorted((row.sent_at for row in seen), reverse=True))
+        self.assertEqual(seen[-3:], [archived[0], history[0], archived[1]])
+        self.assertContains(response, 'Archived')
+
+    def test_export_streams_every_row(self):
+        response = self.client.get(reverse('quote_history_export'))
+        self.assertTrue(response.streaming)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], 'sent_at,quote,author,category,favorite')
+        self.assertEqual(len(lines), 21)
+
+    def test_export_merges_archived_rows_with_old_favorites(self):
+        now = timezone.now()
+        history = UserQuoteHistory.objects.filter(user=self.user).order_by('id')
+        favorite = history[0]
+        UserQuoteHistory.objects.filter(id=favorite.id).update(sent_at=now - timedelta(days=400), is_favorite=True)
+        ArchivedQuoteHistory.objects.create(user=self.user, quote=history[1].quote, sent_at=now - timedelta(days=200))
+
+        response = self.client.get(reverse('quote_history_export'))
+        sent_at = [line.split(',')[0] for line in b''.join(response.streaming_content).decode().splitlines()[1:]]
+        self.assertEqual(len(sent_at), 21)
+        self.assertEqual(sent_at, sorted(sent_at, reverse=True))
+
+
+@override_settings(
+    EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+    CELERY_TASK_ALWAYS_EAGER=True,
+)
+class AnalyticsRollupTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        categories = [Category.objects.create(name=f'Category {i}', slug=f'category-{i}') for i in range(2)]
+        for i in range(6):
+            Quote.objects.create(text=f'Quote {i}', author='Someone', category=categories[i % 2])
+        now = timezone.now()
+        self.users = [
+            User.objects.create(username=f'user{i}', email=f'user{i}@example.com', preferred_time=time(now.hour, now.minute))
+            for i in range(4)
+        ]
+
+    def snapshot(self):
+        return (
+            list(DailyStats.objects.values_list('date', 'deliveries', 'favorites', 'active_users')),
+            sorted(CategoryStats.objects.values_list('category_id', 'deliveries', 'favorites')),
+            sorted(QuoteStats.objects.values_list('quote_id', 'deliveries', 'favorites')),
+        )
+
+    def test_incremental_counters_match_reconciliation(self):
+        send_daily_quotes()
+        history = UserQuoteHistory.objects.filter(user=self.users[0]).get()
+        self.client.force_login(self.users[0])
+        self.client.post(reverse('toggle_favorite', args=[history.id]))
+
+        incremental = self.snapshot()
+        self.assertEqual(incremental[0][0][1:], (4, 1, 4))
+        reconcile()
+        self.assertEqual(self.snapshot(), incremental)
+
+    def test_analytics_page_does_not_count_history(self):
+        staff = User.objects.create(username='staff', is_staff=True)
+        self.client.force_login(staff)
+        self.client.get(reverse('admin_analytics'))
+        # session, user, categories, quotes, daily series, recent deliveries
+        with self.assertNumQueries(6):
+            response = self.client.get(reverse('admin_analytics'))
+        self.assertEqual(response.context['total_users'], 5)
+
+
+class QuoteCatalogTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        catalog.local.clear()
+        self.category = Category.objects.create(name='Courage', slug='courage')
+        self.quotes = [
+            Quote.objects.create(text=f'Quote {i}', author='Someone', category=self.category)
+            for i in range(3)
+        ]
+
+    def test_warm_reads_skip_the_database(self):
+        ids = [quote.id for quote in self.quotes]
+        catalog.categories()
+        catalog.quote_ids_by_category()
+        catalog.quotes(ids)
+
+        with self.assertNumQueries(0):
+            self.assertEqual([category.name for category in catalog.categories()], ['Courage'])
+            self.assertEqual(catalog.quote_ids_by_category(), {self.category.id: ids})
+            self.assertEqual(catalog.quotes(ids)[ids[0]].category.name, 'Courage')
+
+        # A fresh process only has the shared tier
+        catalog.local.clear()
+        with self.assertNumQueries(0):
+            catalog.quotes(ids)
+
+    def test_writes_retire_cached_entries(self):
+        catalog.quote_ids_by_category()
+        catalog.quotes([self.quotes[0].id])
+
+        self.quotes[0].is_active = False
+        self.quotes[0].save()
+        Category.objects.create(name='Hope', slug='hope')
+
+        self.assertEqual(catalog.quote_ids_by_category(), {self.category.id: [q.id for q in self.quotes[1:]]})
+        self.assertEqual(catalog.quotes([self.quotes[0].id]), {})
+        self.assertEqual([category.name for category in catalog.categories()], ['Courage', 'Hope'])
+
+
+class QuoteImportTests(TestCase):
+    def test_import_dedupes_and_creates_categories(self):
+        Category.objects.create(name='Success', slug='success')
+        Quote.objects.create(text='Keep going.', author='Someone', category=Category.objects.get())
+        stream = io.StringIO(
+            'text,author,category\n'
+            '"  keep   GOING. ",Someone else,Success\n'
+            'Dream big.,Dreamer,Hope\n'
+            '“Dream big.”,Dreamer,Hope\n'
+            ',Nobody,Hope\n'
+            'Start now.,,Action\n'
+        )
+
+        counts = QuoteImporter(batch_size=2).run(read_rows(stream, 'csv'))
+
+        self.assertEqual(counts, {'read': 5, 'created': 2, 'duplicates': 2, 'invalid': 1})
+        self.assertEqual(
+            sorted(Quote.objects.values_list('text', 'author', 'category__name')),
+            [('Dream big.', 'Dreamer', 'Hope'), ('Keep going.', 'Someone', 'Success'), ('Start now.', 'Unknown', 'Action')],
+        )
+
+    def test_categories_without_ascii_slugs_stay_apart(self):
+        Category.objects.create(name='Other', slug='category')
+        stream = io.StringIO(
+            '{"text": "Вперёд.", "author": "A", "category": "Мотивация"}\n'
+            '{"text": "Получится.", "author": "B", "category": "Успех"}\n'
+            '{"text": "Wow.", "author": "C", "category": "!!!"}\n'
+            '{"text": "Again!", "author": "D", "category": "???"}\n'
+        )
+
+        QuoteImporter().run(read_rows(stream, 'jsonl'))
+
+        self.assertEqual(
+            sorted(Quote.objects.values_list('text', 'category__name')),
+            [('Again!', '???'), ('Wow.', '!!!'), ('Вперёд.', 'Мотивация'), ('Получится.', 'Успех')],
+        )
+        self.assertEqual(Category.objects.get(name='Мотивация').slug, 'мотивация')
+        self.assertEqual(Category.objects.count(), 5)
+
+    def test_malformed_jsonl_lines_are_reported_and_skipped(self):
+        stream = io.StringIO(
+            '{"text": "Dream big.", "author": "Dreamer", "category": "Hope"}\n'
+            '{"text": "Cut off\n'
+            '["Not", "an", "object"]\n'
+            '\n'
+            '{"text": "Start now.", "author": "Doer", "category": "Action"}\n'
+        )
+        errors = []
+
+        counts = QuoteImporter().run(read_rows(stream, 'jsonl', on_error=lambda number, message: errors.append(number)))
+
+        self.assertEqual(counts, {'read': 4, 'created': 2, 'duplicates': 0, 'invalid': 2})
+        self.assertEqual(errors, [2, 3])
+
+    def test_quotes_stored_by_a_concurrent_import_are_not_counted_as_created(self):
+        category = Category.objects.create(name='Hope', slug='hope')
+        importer = QuoteImporter()
+        importer.categories = {'Hope': category.id}
+        # Stored after the importer's duplicate lookup
+        Quote.objects.create(text='Dream big.', author='Dreamer', category=category)
+        quotes = {
+            content_hash(text): (text, 'Someone', 'Hope') for text in ('Dream big.', 'Start now.')
+        }
+
+        importer.insert(quotes)
+
+        self.assertEqual(list(quotes.values()), [('Start now.', 'Someone', 'Hope')])
+        self.assertEqual(importer.counts['duplicates'], 1)
+        self.assertEqual(Quote.objects.count(), 2)
+
+
+class QuoteDeduplicationTests(TestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name='Success', slug='success')
+        self.quote = Quote.objects.create(text='Keep going.', author='Someone', category=self.category)
+
+    def test_near_duplicates_share_a_hash(self):
+        self.assertEqual(self.quote.content_hash, content_hash('  “KEEP   going.”'))
+        with override_settings(QUOTE_NORMALIZATION=['whitespace']):
+            self.assertNotEqual(content_hash('keep going.'), content_hash('Keep going.'))
+
+    def test_admin_form_rejects_duplicates(self):
+        data = {'text': 'keep  going.', 'author': 'Other', 'category': self.category.id, 'is_active': True}
+        form = QuoteAdminForm(data)
+        self.assertFalse(form.is_valid())
+        self.assertIn(f'quote #{self.quote.pk}', form.errors['text'][0])
+
+        # Saving the quote itself again is not a duplicate
+        self.assertTrue(QuoteAdminForm(data, instance=self.quote).is_valid())
+
+    def test_legacy_duplicates_can_be_edited_and_deactivated(self):
+        legacy = Quote.objects.create(text='Keep going!', author='Other', category=self.category)
+        Quote.objects.filter(pk=legacy.pk).update(text='keep  going.', content_hash=None)
+
+        legacy = Quote.objects.get(pk=legacy.pk)
+        legacy.is_active = False
+        legacy.save()
+        self.assertIsNone(Quote.objects.get(pk=legacy.pk).content_hash)
+
+        data = {'text': 'keep  going.', 'author': 'Someone Else', 'category': self.category.id, 'is_active': False}
+        form = QuoteAdminForm(data, instance=Quote.objects.get(pk=legacy.pk))
+        self.assertTrue(form.is_valid(), form.errors)
+        form.save()
+        self.assertEqual(Quote.objects.get(pk=legacy.pk).author, 'Someone Else')
+
+
+class QuoteSearchTests(TestCase):
+    def setUp(self):
+        category = Category.objects.create(name='Courage', slug='courage')
+        self.brave = Quote.objects.create(text='Fortune favours the brave.', author='Terence', category=category)
+        self.bravery = Quote.objects.create(text='Bravery is contagious.', author='Someone', category=category)
+        Quote.objects.create(text='Be brave enough to start.', author='Hidden', category=category, is_active=False)
+        Quote.objects.create(text='Keep going.', author='Brave Author', category=category)
+
+    def test_index_follows_writes(self):
+        self.assertEqual(search_quotes('fortune')[0], [self.brave])
+        self.brave.text = 'Luck favours the bold.'
+        self.brave.save()
+        self.assertEqual(search_quotes('fortune')[0], [])
+        self.assertEqual(search_quotes('bold')[0], [self.brave])
+        self.brave.delete()
+        self.assertEqual(search_quotes('bold')[0], [])
+
+    def test_ranked_active_results_with_pages(self):
+        quotes, has_next = search_quotes('braves', page_size=1)
+        # Text matches outrank author matches, inactive quotes are left out
+        self.assertEqual(quotes, [self.brave])
+        self.assertTrue(has_next)
+        quotes, has_next = search_quotes('braves', page=2, page_size=1)
+        self.assertEqual([q.author for q in quotes], ['Brave Author'])
+        self.assertFalse(has_next)
+
+    def test_admin_search_uses_the_index(self):
+        queryset = search.matching(Quote.objects.all(), 'Brave')
+        self.assertEqual(queryset.count(), 3)
+
+    def test_search_endpoint(self):
+        self.client.force_login(User.objects.create(username='dave'))
+        response = self.client.get(reverse('quote_search'), {'q': 'fortune'})
+        self.assertContains(response, 'Fortune favours the brave.')
+        response = self.client.get(reverse('quote_search'), {'q': 'brave', 'page': 2}, HTTP_HX_REQUEST='true')
+        self.assertTemplateUsed(response, 'quotes/partials/search_results.html')
+        self.assertTemplateNotUsed(response, 'quotes/search.html')
+
+    def test_pages_past_the_limit_are_empty(self):
+        self.client.force_login(User.objects.create(username='dave'))
+        response = self.client.get(reverse('quote_search'), {'q': 'brave', 'page': '9' * 30})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['quotes'], [])
+        with override_settings(SEARCH_MAX_PAGE=1):
+            self.assertEqual(search_quotes('braves', page_size=1), ([self.brave], False))
+
+    def test_older_matches_are_ranked_too(self):
+        category = self.brave.category
+        Quote.objects.bulk_create([
+            Quote(text=f'Someone wrote a long note mentioning brave once, number {i}.', author='Someone', category=category)
+            for i in range(30)
+        ])
+        self.assertEqual(search_quotes('brave', page_size=1)[0], [self.brave])
+
+
+class SearchIndexRepairTests(TransactionTestCase):
+    def test_migrate_restores_triggers_a_table_rebuild_dropped(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('Only SQLite keeps the index in triggers')
+        category = Category.objects.create(name='Courage', slug='courage')
+        with connection.cursor() as cursor:
+            # What SQLite does to the triggers when a migration rebuilds quotes_quote
+            for sql in search.SQLITE_DROP[:3]:
+                cursor.execute(sql)
+        self.assertFalse(search.is_installed(connection))
+        missed = Quote.objects.create(text='Fortune favours the brave.', author='Terence', category=category)
+
+        emit_post_migrate_signal(verbosity=0, interactive=False, db='default')
+
+        self.assertTrue(search.is_installed(connection))
+        added = Quote.objects.create(text='Bravery is contagious.', author='Someone', category=category)
+        self.assertEqual(search_quotes('fortune')[0], [missed])
+        self.assertEqual(search_quotes('bravery')[0], [added])
@@ -10,9 +10,15 @@ urlpatterns = [
     path('dashboard/', views.dashboard, name='dashboard'),
     path('preferences/', views.preferences, name='preferences'),
     path('history/', views.quote_history, name='quote_history'),
+    path('history/page/', views.quote_history_page, name='quote_history_page'),
+    path('history/export/', views.quote_history_export, name='quote_history_export'),
     path('favorites/', views.favorites, name='favorites'),
+    path('favorites/page/', views.favorites_page, name='favorites_page'),
+    path('search/', views.quote_search, name='quote_search'),
     path('toggle-favorite/<int:history_id>/', views.toggle_favorite, name='toggle_favorite'),
     path('analytics/', views.admin_analytics, name='admin_analytics'),
+    path('analytics/metrics/', views.delivery_metrics, name='delivery_metrics'),
+    path('analytics/queries/', views.query_profile, name='query_profile'),
 
     # Password reset URLs
     path('password-reset/', views.CustomPasswordResetView.as_view(), name='password_reset'),
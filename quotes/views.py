@@ -1,12 +1,29 @@
+import csv
+import heapq
+from datetime import timedelta
+
+from django.conf import settings
+from django.http import HttpResponse, StreamingHttpResponse
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import login, logout, authenticate
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.views import PasswordResetView
 from django.contrib import messages
-from django.db.models import Count
+from django.db import transaction
+from django.db.models import Count, Q
+from django.template.loader import render_to_string
 from django.utils import timezone
+from django.utils.safestring import mark_safe
+from . import metrics, profiling
+from .cache import get_dashboard, invalidate_dashboards, set_dashboard
 from .forms import UserRegistrationForm, UserPreferenceForm, CustomPasswordResetForm
-from .models import User, Quote, Category, UserQuoteHistory, UserPreference
+from .models import (
+    UserQuoteHistory, UserPreference, ArchivedQuoteHistory, CategoryStats, DailyStats, QuoteStats,
+)
+from .pagination import keyset_page
+from .rollups import headline_totals, record_favorite
+from .search import search_quotes
 
 
 def home(request):
@@ -64,17 +81,29 @@ def logout_view(request):
 @login_required
 def dashboard(request):
     """User dashboard showing recent quotes and stats"""
-    recent_quotes = UserQuoteHistory.objects.filter(user=request.user)[:10]
-    favorite_quotes = UserQuoteHistory.objects.filter(user=request.user, is_favorite=True)[:5]
-    total_quotes_received = UserQuoteHistory.objects.filter(user=request.user).count()
-
-    context = {
-        'recent_quotes': recent_quotes,
-        'favorite_quotes': favorite_quotes,
-        'total_quotes_received': total_quotes_received,
+    dashboard_content = get_dashboard(request.user.id)
+    if dashboard_content is None:
+        history = UserQuoteHistory.objects.filter(user=request.user).select_related('quote__category')
+        totals = history.aggregate(
+            received=Count('id'),
+            favorites=Count('id', filter=Q(is_favorite=True)),
+        )
+        context = {
+            'recent_quotes': list(history[:10]),
+            'favorite_quotes': list(history.filter(is_favorite=True)[:5]),
+            'total_quotes_received': (
+                totals['received'] + ArchivedQuoteHistory.objects.filter(user=request.user).count()
+            ),
+            'total_favorites': totals['favorites'],
+            'user': request.user,
+        }
+        dashboard_content = render_to_string('quotes/partials/dashboard_content.html', context, request)
+        set_dashboard(request.user.id, dashboard_content)
+
+    return render(request, 'quotes/dashboard.html', {
+        'dashboard_content': mark_safe(dashboard_content),
         'user': request.user,
-    }
-    return render(request, 'quotes/dashboard.html', context)
+    })
 
 
 @login_required
@@ -86,6 +115,7 @@ def preferences(request):
         form = UserPreferenceForm(request.POST, instance=user_pref)
         if form.is_valid():
             form.save()
+            invalidate_dashboards([request.user.id])
             messages.success(request, 'Your preferences have been updated!')
             if request.htmx:
                 return render(request, 'quotes/partials/preferences_form.html', {'form': form})
@@ -98,17 +128,65 @@ def preferences(request):
 
 @login_required
 def quote_history(request):
-    """View all received quotes"""
-    quotes = UserQuoteHistory.objects.filter(user=request.user)
-    return render(request, 'quotes/history.html', {'quotes': quotes})
+    """View received quotes, one keyset page at a time"""
+    return history_page(request, 'quotes/history.html')
+
+
+@login_required
+def quote_history_page(request):
+    """Next page of the quote history for HTMX infinite scroll"""
+    return history_page(request, 'quotes/partials/history_page.html')
+
+
+@login_required
+def quote_history_export(request):
+    """Stream the user's full quote history as CSV"""
+    live = UserQuoteHistory.objects.filter(user=request.user).order_by('-sent_at', '-id')
+    archived = ArchivedQuoteHistory.objects.filter(user=request.user).order_by('-sent_at', '-id')
+    fields = ('sent_at', 'quote__text', 'quote__author', 'quote__category__name', 'is_favorite')
+
+    def rows():
+        writer = csv.writer(Echo())
+        yield writer.writerow(['sent_at', 'quote', 'author', 'category', 'favorite'])
+        # Old favorites are never archived, so the two streams overlap in time and are merged newest first
+        streams = [
+            queryset.values_list(*fields).iterator(chunk_size=settings.HISTORY_EXPORT_CHUNK_SIZE)
+            for queryset in (live, archived)
+        ]
+        for sent_at, text, author, category, is_favorite in heapq.merge(*streams, key=lambda row: row[0], reverse=True):
+            yield writer.writerow([sent_at.isoformat(), text, author, category, is_favorite])
+
+    response = StreamingHttpResponse(rows(), content_type='text/csv')
+    response['Content-Disposition'] = 'attachment; filename="quote-history.csv"'
+    return response
+
+
+@login_required
+def quote_search(request):
+    """Full-text quote search; HTMX requests get just the next page of results"""
+    terms = request.GET.get('q', '').strip()
+    try:
+        page = max(int(request.GET.get('page', 1)), 1)
+    except ValueError:
+        page = 1
+    quotes, has_next = search_quotes(terms, page, settings.SEARCH_PAGE_SIZE) if terms else ([], False)
+
+    context = {'terms': terms, 'quotes': quotes, 'page': page, 'next_page': page + 1 if has_next else None}
+    if request.htmx:
+        return render(request, 'quotes/partials/search_results.html', context)
+    return render(request, 'quotes/search.html', context)
 
 
 @login_required
 def toggle_favorite(request, history_id):
     """Toggle favorite status of a quote via HTMX"""
-    history = get_object_or_404(UserQuoteHistory, id=history_id, user=request.user)
+    history = get_object_or_404(UserQuoteHistory.objects.select_related('quote'), id=history_id, user=request.user)
     history.is_favorite = not history.is_favorite
-    history.save()
+    # One transaction, so a concurrent reconcile sees both the toggle and its count or neither
+    with transaction.atomic():
+        history.save(update_fields=['is_favorite'])
+        record_favorite(history)
+    invalidate_dashboards([request.user.id])
 
     if request.htmx:
         return render(request, 'quotes/partials/favorite_button.html', {'history': history})
@@ -118,9 +196,32 @@ def toggle_favorite(request, history_id):
 
 @login_required
 def favorites(request):
-    """View all favorite quotes"""
-    favorite_quotes = UserQuoteHistory.objects.filter(user=request.user, is_favorite=True)
-    return render(request, 'quotes/favorites.html', {'quotes': favorite_quotes})
+    """View favorite quotes, one keyset page at a time"""
+    return history_page(request, 'quotes/favorites.html', is_favorite=True)
+
+
+@login_required
+def favorites_page(request):
+    """Next page of favorites for HTMX infinite scroll"""
+    return history_page(request, 'quotes/partials/favorites_page.html', is_favorite=True)
+
+
+def history_page(request, template, **filters):
+    """Render the page of the user's history after ``?cursor=`` with ``template``"""
+    # Old favorites are never archived, so the two tables overlap in time and are merged newest first
+    querysets = [
+        model.objects.filter(user=request.user, **filters).select_related('quote__category')
+        for model in (UserQuoteHistory, ArchivedQuoteHistory)
+    ]
+    quotes, next_cursor = keyset_page(querysets, request.GET.get('cursor'), settings.HISTORY_PAGE_SIZE)
+    return render(request, template, {'quotes': quotes, 'next_cursor': next_cursor})
+
+
+class Echo:
+    """File-like object whose write() hands back the line, for streaming csv.writer output"""
+
+    def write(self, value):
+        return value
 
 
 class CustomPasswordResetView(PasswordResetView):
@@ -138,27 +239,46 @@ def admin_analytics(request):
         messages.error(request, 'You do not have permission to access this page.')
         return redirect('dashboard')
 
-    total_users = User.objects.count()
-    active_users = User.objects.filter(is_active=True).count()
-    total_quotes = Quote.objects.filter(is_active=True).count()
-    total_categories = Category.objects.count()
-    total_sent = UserQuoteHistory.objects.count()
-
     # Category popularity
-    popular_categories = Category.objects.annotate(
-        quote_count=Count('quotes')
-    ).order_by('-quote_count')[:5]
+    popular_categories = CategoryStats.objects.select_related('category').order_by('-deliveries')[:5]
+    favorite_quotes = QuoteStats.objects.select_related('quote').order_by('-favorites')[:5]
+
+    # Deliveries over the last ANALYTICS_SERIES_DAYS days, oldest first
+    since = timezone.localdate() - timedelta(days=settings.ANALYTICS_SERIES_DAYS - 1)
+    daily_stats = list(DailyStats.objects.filter(date__gte=since).order_by('date'))
+    peak_deliveries = max((day.deliveries for day in daily_stats), default=0)
 
     # Recent activity
     recent_deliveries = UserQuoteHistory.objects.select_related('user', 'quote')[:10]
 
     context = {
-        'total_users': total_users,
-        'active_users': active_users,
-        'total_quotes': total_quotes,
-        'total_categories': total_categories,
-        'total_sent': total_sent,
+        **headline_totals(),
         'popular_categories': popular_categories,
+        'favorite_quotes': favorite_quotes,
+        'daily_stats': daily_stats,
+        'peak_deliveries': peak_deliveries,
         'recent_deliveries': recent_deliveries,
     }
     return render(request, 'quotes/admin_analytics.html', context)
+
+
+@staff_member_required
+def delivery_metrics(request):
+    """Delivery pipeline metrics in the Prometheus text format"""
+    return HttpResponse(metrics.exposition(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@staff_member_required
+def query_profile(request):
+    """Per-view and per-task query budget summary"""
+    if request.method == 'POST':
+        profiling.reset()
+        messages.success(request, 'Query profile cleared.')
+        return redirect('query_profile')
+    return render(request, 'quotes/query_profile.html', {
+        'rows': profiling.summary(),
+        'profiling_enabled': settings.QUERY_PROFILING,
+        'query_budget': settings.QUERY_BUDGET_QUERIES,
+        'task_query_budget': settings.QUERY_BUDGET_TASK_QUERIES,
+        'db_budget_ms': settings.QUERY_BUDGET_DB_MS,
+    })